@@ -1,12 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime
+from typing import Optional
 
-from app.db import SessionLocal
+from app.db import get_db
 from app.models import User, WalletTransaction
+from app.usage import totals_by_resource
+from app.rollups import revenue_total, usage_by_resource
 from app.payments import PaymentLog
 from app.admin_auth import admin_auth
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    export_response,
+    keyset,
+    page,
+    stream_rows,
+)
 
 router = APIRouter(
     prefix="/admin",
@@ -15,71 +26,166 @@ router = APIRouter(
 )
 
 # ======================
-# DB DEPENDENCY
+# REVENUE SUMMARY
 # ======================
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@router.get("/revenue")
+def revenue(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # ledger_daily / ledger_hourly rollups (credits = revenue)
+    total = db.execute(revenue_total(start, end)).scalar() or 0
+
+    return {"total_revenue": float(total)}
 
 
 # ======================
-# REVENUE SUMMARY
+# LISTING HELPERS
 # ======================
-@router.get("/revenue")
-def revenue(db: Session = Depends(get_db)):
-    total = (
-        db.query(func.sum(WalletTransaction.amount))
-        .filter(WalletTransaction.amount > 0)
-        .scalar()
-    ) or 0
+def _date_range(stmt, column, start, end):
+    if start is not None:
+        stmt = stmt.where(column >= start)
+    if end is not None:
+        stmt = stmt.where(column < end)
+    return stmt
 
-    return {"total_revenue": float(total)}
+
+def _list_page(db: Session, stmt, columns, cursor, limit):
+    stmt = keyset(stmt, columns, cursor)
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    return page(rows, limit, [col.key for col in columns])
 
 
 # ======================
 # PAYMENTS LIST
 # ======================
-@router.get("/payments")
-def payments(db: Session = Depends(get_db)):
-    return (
-        db.query(PaymentLog)
-        .order_by(PaymentLog.created_at.desc())
-        .limit(100)
-        .all()
+PAYMENT_COLUMNS = ("id", "provider", "reference_id", "created_at")
+PAYMENT_KEYS = [PaymentLog.created_at, PaymentLog.id]
+
+
+def _payments_stmt(provider, start, end):
+    stmt = select(
+        PaymentLog.id,
+        PaymentLog.provider,
+        PaymentLog.reference_id,
+        PaymentLog.created_at,
     )
+    if provider:
+        stmt = stmt.where(PaymentLog.provider == provider)
+    return _date_range(stmt, PaymentLog.created_at, start, end)
+
+
+@router.get("/payments")
+def payments(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    provider: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    return _list_page(db, _payments_stmt(provider, start, end), PAYMENT_KEYS, cursor, limit)
+
+
+@router.get("/payments/export")
+def payments_export(
+    format: str = "csv",
+    provider: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    rows = stream_rows(keyset(_payments_stmt(provider, start, end), PAYMENT_KEYS))
+    return export_response(rows, format, PAYMENT_COLUMNS, "payments")
 
 
 # ======================
 # WALLET TRANSACTIONS
 # ======================
-@router.get("/wallet-transactions")
-def wallet_transactions(db: Session = Depends(get_db)):
-    return (
-        db.query(WalletTransaction)
-        .order_by(WalletTransaction.created_at.desc())
-        .limit(100)
-        .all()
+TXN_COLUMNS = ("id", "user_id", "amount", "reason", "created_at")
+TXN_KEYS = [WalletTransaction.created_at, WalletTransaction.id]
+
+
+def _transactions_stmt(user_id, sign, start, end):
+    stmt = select(
+        WalletTransaction.id,
+        WalletTransaction.user_id,
+        WalletTransaction.amount,
+        WalletTransaction.reason,
+        WalletTransaction.created_at,
     )
+    if user_id is not None:
+        stmt = stmt.where(WalletTransaction.user_id == user_id)
+    if sign == "credit":
+        stmt = stmt.where(WalletTransaction.amount > 0)
+    elif sign == "debit":
+        stmt = stmt.where(WalletTransaction.amount < 0)
+    elif sign is not None:
+        raise HTTPException(status_code=400, detail="sign must be credit or debit")
+    return _date_range(stmt, WalletTransaction.created_at, start, end)
+
+
+@router.get("/wallet-transactions")
+def wallet_transactions(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: Optional[int] = None,
+    sign: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    stmt = _transactions_stmt(user_id, sign, start, end)
+    return _list_page(db, stmt, TXN_KEYS, cursor, limit)
+
+
+@router.get("/wallet-transactions/export")
+def wallet_transactions_export(
+    format: str = "csv",
+    user_id: Optional[int] = None,
+    sign: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    rows = stream_rows(keyset(_transactions_stmt(user_id, sign, start, end), TXN_KEYS))
+    return export_response(rows, format, TXN_COLUMNS, "wallet-transactions")
 
 
 # ======================
 # USER BALANCES
 # ======================
+USER_COLUMNS = ("id", "email", "wallet", "created_at")
+USER_KEYS = [User.id]
+
+
+def _users_stmt(user_id, start, end):
+    stmt = select(User.id, User.email, User.wallet, User.created_at)
+    if user_id is not None:
+        stmt = stmt.where(User.id == user_id)
+    return _date_range(stmt, User.created_at, start, end)
+
+
 @router.get("/users")
-def users(db: Session = Depends(get_db)):
-    return (
-        db.query(
-            User.id,
-            User.email,
-            User.wallet_balance,
-            User.is_active
-        )
-        .order_by(User.id.desc())
-        .all()
-    )
+def users(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    return _list_page(db, _users_stmt(user_id, start, end), USER_KEYS, cursor, limit)
+
+
+@router.get("/users/export")
+def users_export(
+    format: str = "csv",
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    rows = stream_rows(keyset(_users_stmt(user_id, start, end), USER_KEYS))
+    return export_response(rows, format, USER_COLUMNS, "users")
 
 
 # ======================
@@ -161,22 +267,19 @@ def refund_payment(
 # CPU / GPU USAGE STATS
 # ======================
 @router.get("/usage")
-def usage_stats(db: Session = Depends(get_db)):
-    cpu = (
-        db.query(func.sum(WalletTransaction.minutes))
-        .filter(WalletTransaction.resource == "cpu")
-        .scalar()
-    ) or 0
-
-    gpu = (
-        db.query(func.sum(WalletTransaction.minutes))
-        .filter(WalletTransaction.resource == "gpu")
-        .scalar()
-    ) or 0
+def usage_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # usage rollups se (WalletTransaction par minutes/resource nahi hote)
+    totals = totals_by_resource(db.execute(usage_by_resource(start=start, end=end)))
 
     return {
-        "cpu_minutes": cpu,
-        "gpu_minutes": gpu
+        "cpu_minutes": totals.get("cpu", (0, 0))[1],
+        "gpu_minutes": totals.get("gpu", (0, 0))[1],
+        "cpu_cost": totals.get("cpu", (0, 0))[0],
+        "gpu_cost": totals.get("gpu", (0, 0))[0]
     }
 
 
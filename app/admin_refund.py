@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.db import SessionLocal
+from app.db import get_db
 from app.wallet import credit
 from app.admin_auth import admin_auth
 
@@ -10,13 +10,6 @@ router = APIRouter(
     dependencies=[Depends(admin_auth)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/refund")
 def refund(user_id: int, amount: float, db: Session = Depends(get_db)):
     credit(db, user_id, amount, "Admin Refund")
@@ -1,16 +1,96 @@
+import os
+import threading
+import time
+
 from fastapi import Header, HTTPException
 from app.db import SessionLocal
 from app.models import APIKey
+from app.redis_client import r
+from app.cache import TTLCache
+from app.api_key_store import parse_key, verify_secret, hash_secret
+from app.logger import logger
 
-def get_user_from_api_key(x_api_key: str = Header(...)):
+# ==================================================
+# API KEY CACHE (PER WORKER)
+# ==================================================
+# key prefix -> (user_id, key_hash) (None = unknown prefix, negative cache).
+# Hit par bhi secret ka HMAC compare hota hai, DB round trip nahi.
+# /api-keys/revoke Redis pub/sub se sab workers me entry turant hata deta hai.
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", 10000))
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", 60))
+API_KEY_NEGATIVE_TTL = int(os.getenv("API_KEY_NEGATIVE_TTL", 10))
+INVALIDATE_CHANNEL = "apikey:invalidate"
+
+_cache = TTLCache(API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL)
+
+
+def _lookup(api_key: str, prefix: str):
     db = SessionLocal()
     try:
-        row = db.query(APIKey).filter(
-            APIKey.key == x_api_key,
+        # indexed point lookup on prefix
+        row = db.query(APIKey.user_id, APIKey.key_hash).filter(
+            APIKey.prefix == prefix,
             APIKey.active == True
         ).first()
-        if not row:
-            raise HTTPException(status_code=401, detail="Invalid API key")
-        return row.user_id
+        if row:
+            return row.user_id, row.key_hash
+
+        # abhi tak migrate na hua legacy plaintext key
+        row = db.query(APIKey.user_id).filter(
+            APIKey.key == api_key,
+            APIKey.active == True
+        ).first()
+        if row:
+            return row.user_id, hash_secret(parse_key(api_key)[1])
+        return None
     finally:
         db.close()
+
+
+def get_user_from_api_key(x_api_key: str = Header(...)):
+    parsed = parse_key(x_api_key)
+    if parsed is None:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    prefix, secret = parsed
+
+    entry = _cache.get(prefix, default=False)
+    if entry is False:
+        entry = _lookup(x_api_key, prefix)
+        _cache.set(prefix, entry, None if entry else API_KEY_NEGATIVE_TTL)
+
+    if entry is None or not verify_secret(secret, entry[1]):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return entry[0]
+
+
+# ==================================================
+# INVALIDATION (ALL WORKERS)
+# ==================================================
+def invalidate_api_key(prefix: str):
+    _cache.pop(prefix)
+    r.publish(INVALIDATE_CHANNEL, prefix)
+
+
+def _listen():
+    while True:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+            # reconnect ke beech messages miss ho sakte the
+            _cache.clear()
+            while True:
+                msg = pubsub.get_message(timeout=1.0)
+                if msg and msg["type"] == "message":
+                    _cache.pop(msg["data"])
+        except Exception:
+            logger.warning("[API-KEY] invalidation listener reconnecting", exc_info=True)
+            time.sleep(1)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+def start_invalidation_listener():
+    threading.Thread(target=_listen, daemon=True).start()
@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import os
+import secrets
+import sys
+
+from sqlalchemy import inspect, text
+
+from app.db import SessionLocal, engine
+from app.models import APIKey
+from app.auth import SECRET_KEY
+from app.logger import logger
+
+# ==================================================
+# API KEY FORMAT + HASHING
+# ==================================================
+# New keys:    cp_<prefix 12 hex>_<secret 48 hex>
+# Legacy keys: cp_<48 hex>  (prefix = pehle 12 hex, secret = baaki)
+# DB me sirf prefix (unique index) aur HMAC-SHA256(secret) rehta hai.
+API_KEY_PEPPER = os.getenv("API_KEY_PEPPER", SECRET_KEY).encode()
+PREFIX_LEN = 12
+
+
+def hash_secret(secret: str) -> str:
+    return hmac.new(API_KEY_PEPPER, secret.encode(), hashlib.sha256).hexdigest()
+
+
+def generate_key():
+    """Returns (full key, prefix, key_hash)."""
+    prefix = secrets.token_hex(PREFIX_LEN // 2)
+    secret = secrets.token_hex(24)
+    return f"cp_{prefix}_{secret}", prefix, hash_secret(secret)
+
+
+def parse_key(api_key: str):
+    """(prefix, secret) or None if not a cp_ key."""
+    if not api_key.startswith("cp_"):
+        return None
+    body = api_key[3:]
+    if "_" in body:
+        prefix, _, secret = body.partition("_")
+    else:
+        prefix, secret = body[:PREFIX_LEN], body[PREFIX_LEN:]
+    if len(prefix) != PREFIX_LEN or not secret:
+        return None
+    return prefix, secret
+
+
+def verify_secret(secret: str, key_hash: str) -> bool:
+    return hmac.compare_digest(hash_secret(secret), key_hash or "")
+
+
+# ==================================================
+# MIGRATION (PLAINTEXT -> PREFIX + HASH)
+# ==================================================
+def ensure_schema():
+    # create_all purani table me columns add nahi karta
+    columns = {c["name"] for c in inspect(engine).get_columns("api_keys")}
+    with engine.begin() as conn:
+        if "prefix" not in columns:
+            conn.execute(text("ALTER TABLE api_keys ADD COLUMN prefix VARCHAR"))
+        if "key_hash" not in columns:
+            conn.execute(text("ALTER TABLE api_keys ADD COLUMN key_hash VARCHAR"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_api_keys_prefix ON api_keys (prefix)"
+        ))
+
+
+def migrate_legacy_keys(batch_size: int = 500):
+    """Plaintext keys ko prefix + hash me convert karo; idempotent."""
+    migrated = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = (
+                db.query(APIKey)
+                .filter(APIKey.key.isnot(None), APIKey.key_hash.is_(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                parsed = parse_key(row.key)
+                if parsed is None:
+                    # unknown format: key deactivate, plaintext hata do
+                    row.active = False
+                    row.key_hash = ""
+                else:
+                    row.prefix, secret = parsed
+                    row.key_hash = hash_secret(secret)
+                row.key = None
+            db.commit()
+            migrated += len(rows)
+    finally:
+        db.close()
+
+    if migrated:
+        logger.info("[API-KEY] migrated %s legacy keys", migrated)
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m app.api_key_store migrate
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python -m app.api_key_store migrate")
+    ensure_schema()
+    print(f"migrated {migrate_legacy_keys()} keys")
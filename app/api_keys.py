@@ -1,53 +1,77 @@
-import secrets
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from app.db import SessionLocal
+from app.db import get_db
 from app.models import APIKey
 from app.deps import get_current_user
+from app.api_key_auth import invalidate_api_key
+from app.api_key_store import generate_key, parse_key
 
 router = APIRouter(prefix="/api-keys", tags=["API Keys"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def generate_key():
-    return "cp_" + secrets.token_hex(24)
-
 @router.post("/create")
 def create_key(
     user_id: int = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    key = generate_key()
-    db.add(APIKey(user_id=user_id, key=key))
+    # full key sirf ek baar dikhegi; DB me prefix + hash
+    key, prefix, key_hash = generate_key()
+    db.add(APIKey(user_id=user_id, prefix=prefix, key_hash=key_hash))
     db.commit()
-    return {"api_key": key}
+    return {"api_key": key, "prefix": prefix}
 
 @router.get("")
 def list_keys(
     user_id: int = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    return db.query(APIKey).filter(
+    rows = db.query(
+        APIKey.id,
+        APIKey.prefix,
+        APIKey.active,
+        APIKey.created_at
+    ).filter(
         APIKey.user_id == user_id
     ).all()
+    return [
+        {
+            "id": row.id,
+            "prefix": row.prefix,
+            "key": f"cp_{row.prefix}…" if row.prefix else None,
+            "active": row.active,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
 
 @router.post("/revoke")
 def revoke_key(
-    key: str,
+    key: Optional[str] = None,
+    prefix: Optional[str] = None,
     user_id: int = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    # full key ya sirf prefix dono chalenge
+    if key:
+        parsed = parse_key(key)
+        prefix = parsed[0] if parsed else None
+    if not prefix:
+        raise HTTPException(status_code=400, detail="key or prefix required")
+
     row = db.query(APIKey).filter(
-        APIKey.key == key,
+        APIKey.prefix == prefix,
         APIKey.user_id == user_id
     ).first()
+    if not row and key:
+        # legacy (unmigrated) plaintext key
+        row = db.query(APIKey).filter(
+            APIKey.key == key,
+            APIKey.user_id == user_id
+        ).first()
     if not row:
         raise HTTPException(status_code=404, detail="Key not found")
     row.active = False
     db.commit()
+    invalidate_api_key(prefix)
     return {"status": "revoked"}
@@ -1,13 +1,29 @@
+import asyncio
+import multiprocessing
 import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from fastapi import HTTPException
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
+from app.metrics import observe, set_gauge
+
 SECRET_KEY = os.getenv("JWT_SECRET", "change_this_secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# purane (kam rounds wale) hashes needs_update -> login par upgrade
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -15,11 +31,82 @@ def hash_password(password: str):
 def verify_password(password: str, hashed: str):
     return pwd_context.verify(password, hashed)
 
+def verify_and_update(password: str, hashed: str):
+    # (ok, new_hash or None)
+    return pwd_context.verify_and_update(password, hashed)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
+    # jti: per-token id, logout / revocation denylist ke liye
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_token(token: str):
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+# ==================================================
+# BCRYPT OFF THE EVENT LOOP (BOUNDED PROCESS POOL)
+# ==================================================
+# bcrypt ~100-300ms CPU hai; alag process pool me chalao taaki API
+# threads / event loop free rahein. PASSWORD_HASH_MAX_QUEUE se zyada
+# waiting requests ko 503 (load shed), baaki APIs starve nahi hoti.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+
+_pool = None
+_slots = None
+_waiting = 0
+_inflight = 0
+
+def _executor():
+    global _pool, _slots
+    if _pool is None:
+        # fork nahi: tab tak worker me background threads (pub/sub, denylist
+        # sync, payment workers) chal rahe hote hain, forked child unke
+        # locks inherit karke deadlock ho sakta hai
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context(method),
+        )
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+    return _pool
+
+async def _run_hashing(fn, *args):
+    global _waiting, _inflight
+    pool = _executor()
+    if _waiting >= PASSWORD_HASH_MAX_QUEUE:
+        raise HTTPException(
+            status_code=503,
+            detail="Auth busy, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _waiting += 1
+    set_gauge("password_hash_queue_depth", _waiting)
+    queued_at = time.monotonic()
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+        set_gauge("password_hash_queue_depth", _waiting)
+
+    _inflight += 1
+    set_gauge("password_hash_inflight", _inflight)
+    observe("password_hash_wait_seconds", time.monotonic() - queued_at)
+    try:
+        started = time.monotonic()
+        result = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        observe("password_hash_seconds", time.monotonic() - started)
+        return result
+    finally:
+        _inflight -= 1
+        set_gauge("password_hash_inflight", _inflight)
+        _slots.release()
+
+async def hash_password_async(password: str):
+    return await _run_hashing(hash_password, password)
+
+async def verify_and_update_async(password: str, hashed: str):
+    return await _run_hashing(verify_and_update, password, hashed)
@@ -1,39 +1,52 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import get_async_db
 from app.models import User
-from app.auth import hash_password, verify_password, create_access_token
+from app.auth import hash_password_async, verify_and_update_async, create_access_token
+from app.deps import get_token_claims
+from app.token_denylist import revoke
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/signup")
-def signup(email: str, password: str, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == email).first():
+async def signup(email: str, password: str, db: AsyncSession = Depends(get_async_db)):
+    # bcrypt process pool me await hota hai; DB bhi async, event loop block nahi
+    if await db.scalar(select(User.id).where(User.email == email)):
         raise HTTPException(status_code=400, detail="User exists")
 
     user = User(
         email=email,
-        password=hash_password(password),
+        password=await hash_password_async(password),
         wallet=0
     )
     db.add(user)
-    db.commit()
+    await db.commit()
 
     token = create_access_token({"user_id": user.id})
     return {"access_token": token}
 
 @router.post("/login")
-def login(email: str, password: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password):
+async def login(email: str, password: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    ok, new_hash = await verify_and_update_async(password, user.password)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # purane cost factor wala hash -> naye rounds se re-hash
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
     token = create_access_token({"user_id": user.id})
     return {"access_token": token}
+
+@router.post("/logout")
+def logout(claims: dict = Depends(get_token_claims)):
+    # token ko exp tak denylist me daal do
+    if claims["jti"]:
+        revoke(claims["jti"], claims["exp"])
+    return {"status": "logged out"}
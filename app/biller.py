@@ -1,132 +1,385 @@
+import argparse
+import asyncio
+import os
+import signal
 import time
 import traceback
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import HTTPException
 
 from app.redis_client import r
-from app.pricing import CPU_PRICE_PER_MIN, GPU_PRICE_PER_MIN
+from app.plans import user_plans
+from app.pricing_engine import invoice_many
 from app.db import SessionLocal
-from app.wallet import debit
-from app.docker_client import docker_stop
+from app.wallet import debit_many
+from app.cpu_scheduler import stop_cpu_container
+from app.gpu_scheduler import release_legacy, stop_gpu_container
 from app.logger import logger
+from app.metrics import inc, observe
+from app.session_index import (
+    due_sessions,
+    index_key,
+    rebuild_index,
+    session_shard,
+)
+from app.shard_lease import ShardLeases, parse_shard_spec
+from app.subscription_sweeper import start_sweeper
 
 
 BILL_INTERVAL = 60  # seconds
-LOCK_TTL = 55       # redis lock ttl
+LOCK_TTL = 30       # in-flight batch guard, batch ke end me release
+BILL_BATCH_SIZE = int(os.getenv("BILL_BATCH_SIZE", 1000))
+BILL_TICK = int(os.getenv("BILL_TICK", 10))  # lease refresh period, < lease ttl
+SUB_SWEEPER = os.getenv("SUB_SWEEPER", "1") == "1"  # subscription renewals bhi yahin
+STOP_LOCK_TTL = 120  # stop path: container stop + final debit tak
 
 
 # ============================
-# INTERNAL: REDIS LOCK
+# INTERNAL: LOW BALANCE STOP
 # ============================
-def acquire_lock(lock_key: str) -> bool:
-    return r.set(lock_key, "1", nx=True, ex=LOCK_TTL)
+def _stop_cpu_container(user_id: int, data: dict):
+    stop_cpu_container(data)
+
+
+# NOTE:
+# Legacy single-host GPU pods (no node_id) AWS GPU node agent stop karta hai
+# (hum sirf plan ka GPU count free karte hain); scheduler se placed pods hum
+# khud stop karke devices free karte hain
+def _stop_gpu_container(user_id: int, data: dict):
+    if data.get("node_id"):
+        stop_gpu_container(user_id, data)
+    elif data.get("legacy_gpus"):
+        release_legacy(user_id, int(data["legacy_gpus"]))
+
+
+RESOURCES = {
+    "cpu": {
+        "reason": "CPU auto billing ({minutes} min)",
+        "stop": _stop_cpu_container,
+        "stopped_msg": "[BILLER] CPU auto-stopped (low balance) user=%s",
+    },
+    "gpu": {
+        "reason": "GPU auto billing ({minutes} min)",
+        "stop": _stop_gpu_container,
+        "stopped_msg": "[BILLER] GPU billing stopped (low balance) user=%s",
+    },
+}
 
 
 # ============================
-# CPU AUTO BILLING LOOP
+# BATCHED BILLING TICK
 # ============================
-def cpu_billing_loop():
-    logger.info("[BILLER] CPU billing loop started")
+# Session ka n-th interval start + n * BILL_INTERVAL par due hota hai.
+# "billed" field batata hai kitne intervals already charge ho chuke,
+# isliye late tick saare missed intervals ek catch-up debit me le leta hai.
+_RECORD_BILLED = r.register_script("""
+if redis.call('hget', KEYS[1], 'running') ~= '1' then
+    return 0
+end
+redis.call('hincrby', KEYS[1], 'billed', ARGV[1])
+redis.call('hincrbyfloat', KEYS[1], 'accrued', ARGV[2])
+redis.call('zadd', KEYS[2], 'XX', ARGV[3], KEYS[1])
+return 1
+""")
 
-    while True:
-        try:
-            keys = r.keys("cpu:*")
-
-            for key in keys:
-                data = r.hgetall(key)
-                if not data or data.get("running") != "1":
-                    continue
-
-                lock_key = f"lock:{key}"
-                if not acquire_lock(lock_key):
-                    continue  # already billed this minute
-
-                try:
-                    user_id = int(key.split(":")[1])
-                except Exception:
-                    r.delete(lock_key)
-                    continue
-
-                db = SessionLocal()
-                try:
-                    ok = debit(
-                        db,
-                        user_id,
-                        CPU_PRICE_PER_MIN,
-                        "CPU auto billing (1 min)"
-                    )
-                finally:
-                    db.close()
-
-                if not ok:
-                    container = data.get("container")
-                    if container:
-                        docker_stop(container)
-
-                    r.delete(key)
-                    logger.warning(
-                        "[BILLER] CPU auto-stopped (low balance) user=%s",
-                        user_id
-                    )
 
+# ============================
+# SESSION LOCK (STOP PATH)
+# ============================
+# Stop bhi biller wala lock:{key} leta hai: batch in-flight ho to uske release
+# tak rukta hai, phir updated "billed" padhta hai. Stop ke dauran biller is
+# session ko skip karta hai, isliye koi minute do baar charge nahi hota.
+_UNLOCK = r.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+
+def _lock_failed():
+    return HTTPException(status_code=409, detail="Billing in progress, retry")
+
+
+@contextmanager
+def session_lock(key: str):
+    token = uuid.uuid4().hex
+    deadline = time.time() + LOCK_TTL + 1    # batch lock isse pehle expire ho jaata hai
+    while not r.set(f"lock:{key}", token, nx=True, ex=STOP_LOCK_TTL):
+        if time.time() >= deadline:
+            raise _lock_failed()
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        _UNLOCK(keys=[f"lock:{key}"], args=[token])
+
+
+@asynccontextmanager
+async def asession_lock(key: str):
+    token = uuid.uuid4().hex
+    deadline = time.time() + LOCK_TTL + 1
+    while not r.set(f"lock:{key}", token, nx=True, ex=STOP_LOCK_TTL):
+        if time.time() >= deadline:
+            raise _lock_failed()
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        _UNLOCK(keys=[f"lock:{key}"], args=[token])
+
+
+def next_due_at(data: dict, billed: int = None):
+    billed = int(data.get("billed", 0)) if billed is None else billed
+    return int(data.get("start", 0)) + (billed + 1) * BILL_INTERVAL
+
+
+def bill_batch(kind: str, keys: list, now: float = None):
+    """One pipeline for reads + locks, one DB transaction for all debits.
+
+    Returns (sessions billed, max lag in seconds behind due time).
+    """
+    res = RESOURCES[kind]
+    now = time.time() if now is None else now
+
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+        pipe.set(f"lock:{key}", "1", nx=True, ex=LOCK_TTL)
+    replies = pipe.execute()
+
+    sessions = {}   # key -> (user_id, data, intervals)
+    locked_keys = []
+    stale = []
+    early = []
+    lag = 0.0
+    for i, key in enumerate(keys):
+        data, locked = replies[2 * i], replies[2 * i + 1]
+        if not locked:
+            continue  # dusra worker / stop path abhi isse le raha hai
+        locked_keys.append(key)
+        if not data or data.get("running") != "1":
+            stale.append(key)
+            continue
+        try:
+            user_id = int(key.split(":")[1])
+            start = int(data.get("start", 0))
+            billed = int(data.get("billed", 0))
         except Exception:
-            logger.error(
-                "[BILLER] CPU billing loop error\n%s",
-                traceback.format_exc()
-            )
+            stale.append(key)
+            continue
+
+        intervals = int(now - start) // BILL_INTERVAL - billed
+        if intervals <= 0:
+            early.append((key, data))
+            continue
+        sessions[key] = (user_id, data, intervals)
+        lag = max(lag, now - next_due_at(data, billed))
 
-        time.sleep(BILL_INTERVAL)
+    # per-user plan (Redis cache, ek MGET) + time-of-use tariff, ek bulk invoice;
+    # stop path bhi yahi engine use karta hai, isliye dono ka total same
+    plans = user_plans(user_id for user_id, _, _ in sessions.values())
+    invoice = invoice_many([
+        (
+            plans[user_id],
+            kind,
+            int(data["start"]) + int(data.get("billed", 0)) * BILL_INTERVAL,
+            int(data["start"]) + (int(data.get("billed", 0)) + intervals) * BILL_INTERVAL,
+        )
+        for user_id, data, intervals in sessions.values()
+    ])
+    costs = dict(zip(sessions, invoice))
+
+    # fleet pods: ek user ke kai sessions -> ek combined debit
+    charges = {}
+    minutes = {}
+    for key, (user_id, data, intervals) in sessions.items():
+        charges[user_id] = charges.get(user_id, 0) + costs[key]
+        minutes[user_id] = minutes.get(user_id, 0) + intervals
+    reasons = {
+        user_id: res["reason"].format(minutes=n)
+        for user_id, n in minutes.items()
+    }
+
+    # zero cost (free window / free plan) = kuch debit nahi, par session chalta rahe
+    debited = {user_id for user_id, amount in charges.items() if amount <= 0}
+    charges = {user_id: amount for user_id, amount in charges.items() if amount > 0}
+    if charges:
+        db = SessionLocal()
+        try:
+            debited |= debit_many(db, charges, reasons)
+        finally:
+            db.close()
+
+    # debits commit ho chuke: billed/accrued + lock release turant, container
+    # stops (SSH) se pehle - warna stop fail hone par agla tick dobara charge kare
+    unpaid = []
+    pipe = r.pipeline(transaction=False)
+    for key in stale:
+        pipe.zrem(index_key(kind, session_shard(key)), key)
+    for key, data in early:
+        pipe.zadd(index_key(kind, session_shard(key)), {key: next_due_at(data)}, xx=True)
+    for key, (user_id, data, intervals) in sessions.items():
+        if user_id not in debited:
+            unpaid.append((key, user_id, data))
+            continue
+        _RECORD_BILLED(
+            keys=[key, index_key(kind, session_shard(key))],
+            args=[
+                intervals,
+                costs[key],
+                next_due_at(data, int(data.get("billed", 0)) + intervals),
+            ],
+            client=pipe,
+        )
+    # sirf apne liye hue locks; stop path ka lock nahi chhedna. Low-balance
+    # sessions ka lock unke stop tak rehta hai
+    unpaid_keys = {key for key, _, _ in unpaid}
+    for key in locked_keys:
+        if key not in unpaid_keys:
+            pipe.delete(f"lock:{key}")
+    pipe.execute()
+
+    for key, user_id, data in unpaid:
+        _stop_unpaid(kind, key, user_id, data)
+
+    return len(debited), lag
+
+
+def _stop_unpaid(kind: str, key: str, user_id: int, data: dict):
+    # low balance: container stop, phir session hatao. Stop fail ho to session
+    # rehta hai (abhi bhi due) - agla tick phir try karega, baaki batch par asar nahi
+    res = RESOURCES[kind]
+    try:
+        res["stop"](user_id, data)
+    except Exception:
+        logger.error("[BILLER] stop failed key=%s\n%s", key, traceback.format_exc())
+        r.delete(f"lock:{key}")
+        return
+
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(key)
+    pipe.zrem(index_key(kind, session_shard(key)), key)
+    if key.count(":") == 2:
+        # fleet pod {kind}:{user_id}:{pod_id}
+        pipe.srem(f"fleet:{kind}:{user_id}", key.split(":")[2])
+    pipe.delete(f"lock:{key}")
+    pipe.execute()
+    logger.warning(res["stopped_msg"], user_id)
+
+
+def bill_tick(kind: str, shards, now: float = None):
+    # due sessions ko BILL_BATCH_SIZE ke chunks me nipta do
+    now = time.time() if now is None else now
+    billed, lag = 0, 0.0
+    for shard in shards:
+        keys = due_sessions(kind, shard, now)
+        for i in range(0, len(keys), BILL_BATCH_SIZE):
+            n, batch_lag = bill_batch(kind, keys[i:i + BILL_BATCH_SIZE], now)
+            billed += n
+            lag = max(lag, batch_lag)
+    return billed, lag
+
+
+def earliest_due(shards):
+    pipe = r.pipeline(transaction=False)
+    for kind in RESOURCES:
+        for shard in shards:
+            pipe.zrange(index_key(kind, shard), 0, 0, withscores=True)
+    heads = [row[0][1] for row in pipe.execute() if row]
+    return min(heads) if heads else None
+
+
+def _publish_metrics(slot: int, total: int, kind: str, billed: int, lag: float, took: float):
+    observe(f"biller_{kind}_lag_seconds", lag)
+    observe(f"biller_{kind}_tick_seconds", took)
+    inc(f"biller_{kind}_billed_total", billed)
+
+    prefix = f"{slot}/{total}:{kind}"
+    r.hset(
+        "metrics:biller",
+        mapping={
+            f"{prefix}_lag_seconds": round(lag, 3),
+            f"{prefix}_tick_seconds": round(took, 3),
+            f"{prefix}_billed": billed,
+            f"{prefix}_updated_at": int(time.time()),
+        },
+    )
 
 
 # ============================
-# GPU AUTO BILLING LOOP
+# BILLER WORKER (SHARDED)
 # ============================
-# NOTE:
-# Render backend par GPU/Docker calls allowed nahi
-# Actual GPU stop AWS GPU node agent karega
-def gpu_billing_loop():
-    logger.info("[BILLER] GPU billing loop started")
+def run_worker(slot: int = 0, total: int = 1):
+    logger.info("[BILLER] worker started shard=%s/%s", slot, total)
+    leases = ShardLeases(slot, total)
 
-    while True:
-        try:
-            keys = r.keys("gpu:*")
-
-            for key in keys:
-                data = r.hgetall(key)
-                if not data or data.get("running") != "1":
-                    continue
-
-                lock_key = f"lock:{key}"
-                if not acquire_lock(lock_key):
-                    continue
-
-                try:
-                    user_id = int(key.split(":")[1])
-                except Exception:
-                    r.delete(lock_key)
-                    continue
-
-                db = SessionLocal()
-                try:
-                    ok = debit(
-                        db,
-                        user_id,
-                        GPU_PRICE_PER_MIN,
-                        "GPU auto billing (1 min)"
-                    )
-                finally:
-                    db.close()
-
-                if not ok:
-                    # GPU stop handled by AWS agent
-                    r.delete(key)
-                    logger.warning(
-                        "[BILLER] GPU billing stopped (low balance) user=%s",
-                        user_id
-                    )
+    if slot == 0:
+        for kind in RESOURCES:
+            rebuild_index(kind, BILL_INTERVAL)
+
+    # renewal sweeper apne thread me (Redis lock se fleet me ek hi chalta hai)
+    if SUB_SWEEPER:
+        start_sweeper()
+
+    next_refresh = 0.0
+    shards = set()
+    try:
+        while True:
+            try:
+                if time.time() >= next_refresh:
+                    shards = leases.refresh()
+                    next_refresh = time.time() + BILL_TICK
+
+                for kind in RESOURCES:
+                    started = time.time()
+                    billed, lag = bill_tick(kind, sorted(shards), started)
+                    took = time.time() - started
+                    _publish_metrics(slot, total, kind, billed, lag, took)
+                    if billed:
+                        logger.info(
+                            "[BILLER] %s tick billed=%s lag=%.3fs took=%.3fs",
+                            kind.upper(), billed, lag, took
+                        )
+
+                # fixed sleep nahi: agle due session ya lease refresh tak
+                wake = next_refresh
+                head = earliest_due(shards)
+                if head is not None:
+                    # locked/in-flight sessions par busy loop na ho
+                    wake = min(wake, max(head, time.time() + 1))
+            except Exception:
+                logger.error(
+                    "[BILLER] billing tick error\n%s",
+                    traceback.format_exc()
+                )
+                wake = time.time() + 1
+
+            time.sleep(max(0, wake - time.time()))
+    finally:
+        # leases turant chhod do taaki baaki workers shards utha lein
+        leases.release_all()
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CloudPod biller worker")
+    parser.add_argument(
+        "--shard",
+        default="0/1",
+        help="worker slot i of N, e.g. 2/8 (default: 0/1, single worker)",
+    )
+    args = parser.parse_args()
+
+    slot, total = parse_shard_spec(args.shard)
+    signal.signal(signal.SIGTERM, _terminate)
+    run_worker(slot, total)
 
-        except Exception:
-            logger.error(
-                "[BILLER] GPU billing loop error\n%s",
-                traceback.format_exc()
-            )
 
-        time.sleep(BILL_INTERVAL)
+if __name__ == "__main__":
+    main()
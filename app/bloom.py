@@ -0,0 +1,26 @@
+import hashlib
+import math
+
+# ==================================================
+# BLOOM FILTER (IN-MEMORY)
+# ==================================================
+# "maybe present" ya "definitely absent"; false positive ko caller
+# Redis se confirm karta hai.
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
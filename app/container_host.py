@@ -0,0 +1,178 @@
+import asyncio
+import os
+import shlex
+import subprocess
+import threading
+
+from app.logger import logger
+
+# ==================================================
+# CONTAINER HOST CONTROL (SSH MULTIPLEXED)
+# ==================================================
+# Har host ke liye ek persistent SSH ControlMaster connection; har docker
+# command usi socket par naya channel kholta hai, handshake dobara nahi.
+# Address "fake://<name>" ek in-memory FakeHost deta hai (tests / local dev).
+SSH_CONTROL_DIR = os.getenv("SSH_CONTROL_DIR", "/tmp/cloudpod-ssh")
+SSH_CONTROL_PERSIST = os.getenv("SSH_CONTROL_PERSIST", "10m")
+# sshd MaxSessions (default 10) se zyada channels ek master par nahi khulte
+HOST_CONCURRENCY = int(os.getenv("DOCKER_HOST_CONCURRENCY", 10))
+
+
+class DockerError(Exception):
+    pass
+
+
+class SSHHost:
+    def __init__(self, address: str):
+        self.address = address
+        self._master_lock = threading.Lock()
+        self._master_ready = False
+        self._sem = None
+
+    def _ssh_args(self):
+        return [
+            "ssh",
+            "-o", "BatchMode=yes",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={SSH_CONTROL_DIR}/%C",
+            "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+            self.address,
+        ]
+
+    @staticmethod
+    def _remote(args):
+        # ssh remote shell me command string banta hai, isliye quote karo
+        return ["docker", *(shlex.quote(a) for a in args)]
+
+    def _master_args(self):
+        # background master: -M (master) -N (no command) -f (fork)
+        return self._ssh_args()[:-1] + ["-M", "-N", "-f", self.address]
+
+    def _ensure_master(self):
+        if self._master_ready:
+            return
+        with self._master_lock:
+            if self._master_ready:
+                return
+            os.makedirs(SSH_CONTROL_DIR, mode=0o700, exist_ok=True)
+            check = subprocess.run(
+                self._ssh_args()[:-1] + ["-O", "check", self.address],
+                capture_output=True,
+            )
+            if check.returncode != 0:
+                subprocess.run(self._master_args(), check=True, capture_output=True)
+                logger.info("[HOST] ssh master opened host=%s", self.address)
+            self._master_ready = True
+
+    def _failed(self, args, returncode, stderr):
+        # master mar gaya ho to agli call par dobara kholo
+        self._master_ready = False
+        cmd = " ".join(shlex.quote(a) for a in args)
+        raise DockerError(
+            f"docker {cmd} failed on {self.address} "
+            f"(exit {returncode}): {stderr.strip()}"
+        )
+
+    def docker(self, *args) -> str:
+        self._ensure_master()
+        proc = subprocess.run(
+            self._ssh_args() + self._remote(args),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            self._failed(args, proc.returncode, proc.stderr)
+        return proc.stdout
+
+    async def adocker(self, *args) -> str:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(HOST_CONCURRENCY)
+
+        async with self._sem:
+            if not self._master_ready:
+                await asyncio.to_thread(self._ensure_master)
+            proc = await asyncio.create_subprocess_exec(
+                *self._ssh_args(), *self._remote(args),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            self._failed(args, proc.returncode, stderr.decode())
+        return stdout.decode()
+
+
+# ==================================================
+# FAKE HOST (TESTS / LOCAL DEV)
+# ==================================================
+class FakeHost:
+    """In-memory docker host; `run`, `rm`, `rename`, `diff`, `top`, `ps` samajhta hai."""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.containers = {}    # name -> {"image": ..., "args": [...]}
+        self.calls = []
+
+    def docker(self, *args) -> str:
+        self.calls.append(args)
+        cmd, rest = args[0], list(args[1:])
+
+        if cmd == "run":
+            name = rest[rest.index("--name") + 1]
+            if name in self.containers:
+                raise DockerError(f"container name {name} already in use")
+            # image = pehla non-flag arg jo kisi flag ki value nahi hai
+            image = next(
+                a for i, a in enumerate(rest)
+                if not a.startswith("-") and (i == 0 or rest[i - 1] not in ("--name", "--gpus", "--label"))
+            )
+            self.containers[name] = {"image": image, "args": rest}
+            return name + "\n"
+
+        if cmd == "rm":
+            for name in (a for a in rest if not a.startswith("-")):
+                self.containers.pop(name, None)
+            return ""
+
+        if cmd == "rename":
+            old, new = rest
+            if old not in self.containers:
+                raise DockerError(f"no such container {old}")
+            self.containers[new] = self.containers.pop(old)
+            return ""
+
+        if cmd == "diff":
+            if rest[0] not in self.containers:
+                raise DockerError(f"no such container {rest[0]}")
+            return ""
+
+        if cmd == "top":
+            if rest[0] not in self.containers:
+                raise DockerError(f"no such container {rest[0]}")
+            return "PID\n1\n"
+
+        if cmd == "ps":
+            return "".join(f"{name}\n" for name in self.containers)
+
+        raise DockerError(f"FakeHost: unsupported docker command {cmd}")
+
+    async def adocker(self, *args) -> str:
+        await asyncio.sleep(0)
+        return self.docker(*args)
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_host(address: str):
+    with _hosts_lock:
+        host = _hosts.get(address)
+        if host is None:
+            if address.startswith("fake://"):
+                host = FakeHost(address)
+            else:
+                host = SSHHost(address)
+            _hosts[address] = host
+        return host
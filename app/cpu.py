@@ -1,35 +1,28 @@
 import time
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
 from app.redis_client import r
-from app.db import SessionLocal
+from app.db import get_db
 from app.wallet import debit
-from app.models import Usage
-from app.docker_client import docker_run, docker_stop
+from app.rollups import add_usage
+from app.cpu_scheduler import start_cpu_container, stop_cpu_container
 from app.deps import get_current_user
 from app.api_key_auth import get_user_from_api_key
 from app.rate_limit import rate_limit
-from app.pricing_engine import resolve_price
+from app.pricing_engine import resolve_session_cost
+from app.session_index import register_session, unregister_session
+from app.biller import BILL_INTERVAL, session_lock
 
 router = APIRouter(prefix="/cpu", tags=["CPU"])
 
-# ==================================================
-# DB DEPENDENCY
-# ==================================================
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ==================================================
 # INTERNAL START LOGIC
 # ==================================================
-def _start_cpu(user_id: int):
+async def _start_cpu(user_id: int, response: Response = None):
     # rate limit: 5 starts / minute / user
-    rate_limit(f"cpu_start:{user_id}", limit=5, window=60)
+    limit = rate_limit(f"cpu_start:{user_id}", limit=5, window=60)
+    if response is not None:
+        limit.apply(response)
 
     key = f"cpu:{user_id}"
 
@@ -37,16 +30,23 @@ def _start_cpu(user_id: int):
         return {"error": "CPU already running"}
 
     container_name = f"cloudpod-cpu-{user_id}"
-    docker_run(container_name)
 
+    # placement: cpu_nodes me se least-loaded node
+    placement = await start_cpu_container(container_name)
+
+    start = int(time.time())
     r.hset(
         key,
         mapping={
-            "start": int(time.time()),
+            "start": start,
             "running": 1,
             "container": container_name,
+            "billed": 0,      # minutes already charged by biller
+            "accrued": 0,
+            **placement,      # node_id / host (stop + biller isi host par jaate hain)
         },
     )
+    register_session("cpu", key, start + BILL_INTERVAL)
 
     return {
         "status": "CPU started",
@@ -60,25 +60,34 @@ def _start_cpu(user_id: int):
 # ==================================================
 def _stop_cpu(user_id: int, db):
     key = f"cpu:{user_id}"
+    # biller ka in-flight batch khatam hone do, phir updated "billed" padho;
+    # stop ke dauran biller is session ko skip karta hai
+    with session_lock(key):
+        return _stop_cpu_locked(user_id, key, db)
+
+
+def _stop_cpu_locked(user_id: int, key: str, db):
     data = r.hgetall(key)
 
     if not data or data.get("running") != "1":
         return {"error": "CPU not running"}
 
-    container = data.get("container")
-    if container:
-        docker_stop(container)
+    stop_cpu_container(data)
 
     start_time = int(data.get("start", 0))
     seconds = int(time.time()) - start_time
     minutes = max(1, seconds // 60)
 
-    # 🔥 PLAN-AWARE PRICING
-    price_per_min = resolve_price(user_id, "cpu")
-    cost = minutes * price_per_min
+    # biller already charged "billed" minutes; sirf baaki ka charge karo
+    billed = int(data.get("billed", 0))
+    accrued = float(data.get("accrued", 0))
+
+    # 🔥 PLAN-AWARE, TIME-OF-USE PRICING (minutes billed..minutes)
+    cost = resolve_session_cost(user_id, "cpu", start_time, billed, minutes)
 
-    ok = debit(db, user_id, cost, f"CPU usage {minutes} min")
+    ok = debit(db, user_id, cost, f"CPU usage {minutes} min") if cost > 0 else True
     r.delete(key)
+    unregister_session("cpu", key)
 
     if not ok:
         return {
@@ -87,15 +96,10 @@ def _stop_cpu(user_id: int, db):
             "cost": cost,
         }
 
-    # save usage
-    db.add(
-        Usage(
-            user_id=user_id,
-            resource="cpu",
-            minutes=minutes,
-            cost=cost,
-        )
-    )
+    cost += accrued
+
+    # save usage (+ daily/hourly rollups, same transaction)
+    add_usage(db, user_id, "cpu", minutes, cost)
     db.commit()
 
     return {
@@ -109,10 +113,11 @@ def _stop_cpu(user_id: int, db):
 # UI AUTH ENDPOINTS
 # ==================================================
 @router.post("/start")
-def start_cpu(
+async def start_cpu(
+    response: Response,
     user_id: int = Depends(get_current_user),
 ):
-    return _start_cpu(user_id)
+    return await _start_cpu(user_id, response)
 
 
 @router.post("/stop")
@@ -127,10 +132,11 @@ def stop_cpu(
 # API KEY ENDPOINTS (SDK / AUTOMATION)
 # ==================================================
 @router.post("/api/start")
-def start_cpu_api(
+async def start_cpu_api(
+    response: Response,
     user_id: int = Depends(get_user_from_api_key),
 ):
-    return _start_cpu(user_id)
+    return await _start_cpu(user_id, response)
 
 
 @router.post("/api/stop")
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.redis_client import r
+from app.db import SessionLocal
+from app.models import CPUNode
+from app.docker_client import (
+    CPU_POD_MEMORY_MB,
+    CPU_POD_VCPU,
+    docker_run_async,
+    docker_stop,
+)
+from app.logger import logger
+
+# ==================================================
+# CPU NODE REGISTRY + LEAST-LOADED PLACEMENT
+# ==================================================
+# Har node ka used vCPU / memory Redis hash cpu:load:{node_id} me.
+# Placement memory wale capacity view se node chunta hai (koi read nahi),
+# phir Lua script atomically reserve karta hai; har start/stop par view
+# update hota hai aur CPU_NODE_REFRESH sec me Redis/DB se resync.
+CPU_NODE_REFRESH = int(os.getenv("CPU_NODE_REFRESH", 30))
+
+_RESERVE = r.register_script("""
+local vcpu = tonumber(redis.call('hget', KEYS[1], 'vcpu') or '0')
+local mem = tonumber(redis.call('hget', KEYS[1], 'mem') or '0')
+if vcpu + tonumber(ARGV[1]) > tonumber(ARGV[3]) or mem + tonumber(ARGV[2]) > tonumber(ARGV[4]) then
+    return nil
+end
+return {
+    redis.call('hincrbyfloat', KEYS[1], 'vcpu', ARGV[1]),
+    tostring(redis.call('hincrby', KEYS[1], 'mem', ARGV[2])),
+}
+""")
+
+_nodes = {}      # node_id -> {"ssh_host", "total_vcpu", "total_memory_mb"}
+_load = {}       # node_id -> {"vcpu": used, "mem": used}
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _load_key(node_id):
+    return f"cpu:load:{node_id}"
+
+
+def refresh_nodes(force: bool = False):
+    global _nodes, _loaded_at
+    with _lock:
+        if not force and time.time() - _loaded_at < CPU_NODE_REFRESH:
+            return _nodes
+
+        db = SessionLocal()
+        try:
+            rows = db.query(CPUNode).all()
+        finally:
+            db.close()
+
+        _nodes = {
+            row.id: {
+                "ssh_host": row.ssh_host,
+                "total_vcpu": row.total_vcpu or 0,
+                "total_memory_mb": row.total_memory_mb or 0,
+            }
+            for row in rows
+        }
+
+        pipe = r.pipeline(transaction=False)
+        for node_id in _nodes:
+            pipe.hgetall(_load_key(node_id))
+        _load.clear()
+        for node_id, used in zip(_nodes, pipe.execute()):
+            _load[node_id] = {
+                "vcpu": float(used.get("vcpu", 0)),
+                "mem": int(used.get("mem", 0)),
+            }
+
+        _loaded_at = time.time()
+        return _nodes
+
+
+def _utilisation(node_id):
+    node, used = _nodes[node_id], _load[node_id]
+    return max(
+        used["vcpu"] / node["total_vcpu"] if node["total_vcpu"] else 1.0,
+        used["mem"] / node["total_memory_mb"] if node["total_memory_mb"] else 1.0,
+    )
+
+
+def capacity_view():
+    refresh_nodes()
+    return {
+        node_id: {
+            **_nodes[node_id],
+            "used_vcpu": _load[node_id]["vcpu"],
+            "used_memory_mb": _load[node_id]["mem"],
+        }
+        for node_id in _nodes
+    }
+
+
+def place():
+    """Least-loaded fitting node reserve karo; returns (node_id, ssh_host)."""
+    refresh_nodes()
+    for node_id in sorted(_nodes, key=_utilisation):
+        node = _nodes[node_id]
+        used = _RESERVE(
+            keys=[_load_key(node_id)],
+            args=[CPU_POD_VCPU, CPU_POD_MEMORY_MB, node["total_vcpu"], node["total_memory_mb"]],
+        )
+        if used is None:
+            # cache purana tha; is node ko full maan lo
+            _load[node_id] = {"vcpu": node["total_vcpu"], "mem": node["total_memory_mb"]}
+            continue
+        _load[node_id] = {"vcpu": float(used[0]), "mem": int(used[1])}
+        return node_id, node["ssh_host"]
+
+    raise HTTPException(status_code=503, detail="No CPU capacity available")
+
+
+def release(node_id: int):
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrbyfloat(_load_key(node_id), "vcpu", -CPU_POD_VCPU)
+    pipe.hincrby(_load_key(node_id), "mem", -CPU_POD_MEMORY_MB)
+    vcpu, mem = pipe.execute()
+    _load[node_id] = {"vcpu": max(0.0, float(vcpu)), "mem": max(0, int(mem))}
+
+
+# ==================================================
+# CONTAINER LIFECYCLE
+# ==================================================
+async def start_cpu_container(container_name: str):
+    """Place + run; returns fields for the cpu session hash."""
+    # node refresh (DB query) + placement (Redis) sync hain: event loop par nahi
+    if not await asyncio.to_thread(refresh_nodes):
+        # legacy single host (DOCKER_HOST_SSH)
+        await docker_run_async(container_name)
+        return {}
+
+    node_id, host = await asyncio.to_thread(place)
+    try:
+        await docker_run_async(container_name, host=host)
+    except Exception:
+        await asyncio.to_thread(release, node_id)
+        raise
+
+    logger.info("[CPU] placed %s on node=%s", container_name, node_id)
+    return {"node_id": node_id, "host": host}
+
+
+def stop_cpu_container(data: dict):
+    container = data.get("container")
+    if not container:
+        return
+    docker_stop(container, host=data.get("host"))
+    if data.get("node_id"):
+        release(int(data["node_id"]))
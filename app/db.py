@@ -1,22 +1,114 @@
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from app import metrics
 
 # Database URL (env se ya default sqlite)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cloudpod.db")
 
+# ==================================================
+# POOL SETTINGS (ENV)
+# ==================================================
+# Har process ka max connections = DB_POOL_SIZE + DB_MAX_OVERFLOW.
+# workers * us number ko Postgres max_connections se neeche rakho
+# (bench/pool_exhaustion.py se size karo).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# pre_ping = har checkout par ek extra round trip; recycle kaafi ho to band karo
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# LIFO: idle connections server side timeout ho sakein, hot set chhota rahe
+DB_POOL_LIFO = os.getenv("DB_POOL_LIFO", "1") == "1"
+# PgBouncer (transaction mode) ke peeche: pooling bouncer karega, yahan NullPool
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+class _WaitTimedPool:
+    # checkout ka wait time (pool full ho to yahin block hota hai)
+    metric_prefix = "db_pool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metrics.inc(f"{self.metric_prefix}_timeouts")
+            raise
+        finally:
+            metrics.observe(f"{self.metric_prefix}_wait_seconds", time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_WaitTimedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(_WaitTimedPool, AsyncAdaptedQueuePool):
+    metric_prefix = "db_async_pool"
+
+
+def _pool_args(poolclass):
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": DB_POOL_LIFO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
 # SQLite ke liye special args
 connect_args = {}
+engine_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+elif DB_PGBOUNCER:
+    engine_args = {"poolclass": NullPool}
+else:
+    engine_args = _pool_args(InstrumentedQueuePool)
 
 # Engine
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args=connect_args
+    connect_args=connect_args,
+    **engine_args
 )
 
+
+# ==================================================
+# POOL METRICS
+# ==================================================
+def _gauges(pool, prefix):
+    if isinstance(pool, QueuePool):
+        metrics.set_gauge(f"{prefix}_checked_out", pool.checkedout())
+        metrics.set_gauge(f"{prefix}_overflow", max(0, pool.overflow()))
+        metrics.set_gauge(f"{prefix}_size", pool.size())
+
+
+def _instrument(sync_engine, prefix):
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.inc(f"{prefix}_connects")
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _gauges(sync_engine.pool, prefix)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        _gauges(sync_engine.pool, prefix)
+
+
+_instrument(engine, "db_pool")
+
+
 # Session
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -24,10 +116,73 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
-# Dependency (FastAPI ke liye)
+def ensure_indexes(*models):
+    # create_all purani table par naye indexes nahi banata
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def drop_indexes(*names):
+    # model se hataye gaye indexes purani DBs se bhi hatao (writes sasti)
+    with engine.begin() as conn:
+        for name in names:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+# Dependency (FastAPI ke liye) - saare routers yahi use karte hain
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# ==================================================
+# ASYNC ENGINE (asyncpg / aiosqlite)
+# ==================================================
+# I/O-bound handlers (wallet, usage, webhooks) event loop par hi chalte hain,
+# threadpool ki limit nahi lagti. Same DATABASE_URL, sirf driver badalta hai.
+def _async_url(url: str):
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg:", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+async_engine_args = {}
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    pass
+elif DB_PGBOUNCER:
+    # transaction mode me prepared statements connection ke saath nahi rehte
+    async_engine_args = {
+        "poolclass": NullPool,
+        "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+    }
+else:
+    async_engine_args = _pool_args(InstrumentedAsyncPool)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_args)
+_instrument(async_engine.sync_engine, "db_async_pool")
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_gauges():
+    _gauges(engine.pool, "db_pool")
+    _gauges(async_engine.sync_engine.pool, "db_async_pool")
@@ -1,13 +1,59 @@
+import os
+import time
+
 from fastapi import Depends, Header, HTTPException
 from app.auth import decode_token
+from app.cache import TTLCache
+from app.token_denylist import is_revoked
+
+# ==================================================
+# VERIFIED TOKEN CACHE
+# ==================================================
+# signature -> (token, claims); entry token ke exp se aage kabhi nahi rehti.
+# Repeat requests par HS256 verify skip, denylist check har baar hota hai.
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 10000))
+JWT_CACHE_TTL = int(os.getenv("JWT_CACHE_TTL", 300))
+
+_verified = TTLCache(JWT_CACHE_SIZE, JWT_CACHE_TTL)
+
+
+def _verify(token: str):
+    payload = decode_token(token)
+
+    # sirf expected claims accept karo
+    user_id = payload.get("user_id")
+    exp = payload.get("exp")
+    if not isinstance(user_id, int) or isinstance(user_id, bool) or not isinstance(exp, (int, float)):
+        raise ValueError("invalid claims")
+
+    return {"user_id": user_id, "exp": exp, "jti": payload.get("jti")}
 
-def get_current_user(authorization: str = Header(...)):
+
+def get_token_claims(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401)
 
     token = authorization.split(" ")[1]
-    try:
-        payload = decode_token(token)
-        return payload["user_id"]
-    except Exception:
+    signature = token.rsplit(".", 1)[-1]
+
+    cached = _verified.get(signature)
+    if cached and cached[0] == token:
+        claims = cached[1]
+    else:
+        try:
+            claims = _verify(token)
+        except Exception:
+            raise HTTPException(status_code=401)
+        ttl = min(JWT_CACHE_TTL, claims["exp"] - time.time())
+        if ttl > 0:
+            _verified.set(signature, (token, claims), ttl)
+
+    if claims["exp"] <= time.time():
         raise HTTPException(status_code=401)
+    if claims["jti"] and is_revoked(claims["jti"]):
+        raise HTTPException(status_code=401)
+    return claims
+
+
+def get_current_user(claims: dict = Depends(get_token_claims)):
+    return claims["user_id"]
@@ -1,20 +1,46 @@
-import subprocess
 import os
 
-DOCKER_HOST = os.getenv("DOCKER_HOST_SSH")  # user@VPS_IP
+from app.container_host import get_host
+from app.warm_pool import WarmPool, register_pool
 
-def docker_run(container_name: str):
-    cmd = [
-        "ssh", DOCKER_HOST,
-        "docker", "run", "-d",
+DOCKER_HOST = os.getenv("DOCKER_HOST_SSH")  # user@VPS_IP  (or fake://cpu)
+CPU_IMAGE = "python:3.11-slim"
+CPU_POD_VCPU = float(os.getenv("CPU_POD_VCPU", 1.0))
+CPU_POD_MEMORY_MB = int(os.getenv("CPU_POD_MEMORY_MB", 512))
+
+def _run_args(container_name: str):
+    return [
+        "run", "-d",
         "--name", container_name,
-        "--cpus=1.0",
-        "--memory=512m",
-        "python:3.11-slim",
+        f"--cpus={CPU_POD_VCPU}",
+        f"--memory={CPU_POD_MEMORY_MB}m",
+        CPU_IMAGE,
         "sleep", "infinity"
     ]
-    subprocess.run(cmd, check=True)
 
-def docker_stop(container_name: str):
-    cmd = ["ssh", DOCKER_HOST, "docker", "rm", "-f", container_name]
-    subprocess.run(cmd, check=True)
+# har host ka apna warm pool (cpu_nodes se naye hosts lazily)
+_pools = {}
+
+def _pool_for(host: str):
+    pool = _pools.get(host)
+    if pool is None:
+        pool = _pools[host] = register_pool(WarmPool("cpu", host, CPU_IMAGE, _run_args))
+    return pool
+
+cpu_pool = _pool_for(DOCKER_HOST)
+
+def docker_run(container_name: str, host: str = None):
+    get_host(host or DOCKER_HOST).docker(*_run_args(container_name))
+
+def docker_stop(container_name: str, host: str = None):
+    get_host(host or DOCKER_HOST).docker("rm", "-f", container_name)
+
+# async variants (event loop / worker thread block nahi hota)
+async def docker_run_async(container_name: str, host: str = None):
+    host = host or DOCKER_HOST
+    if await _pool_for(host).claim(container_name):
+        return
+    await get_host(host).adocker(*_run_args(container_name))
+
+async def docker_stop_async(container_name: str, host: str = None):
+    await get_host(host or DOCKER_HOST).adocker("rm", "-f", container_name)
@@ -1,20 +1,37 @@
-import subprocess
 import os
 
-GPU_DOCKER_HOST = os.getenv("GPU_DOCKER_HOST_SSH")  # user@GPU_VPS_IP
+from app.container_host import get_host
+from app.warm_pool import WarmPool, register_pool
 
-def gpu_docker_run(container_name: str):
-    cmd = [
-        "ssh", GPU_DOCKER_HOST,
-        "docker", "run", "-d",
-        "--gpus", "all",
+GPU_DOCKER_HOST = os.getenv("GPU_DOCKER_HOST_SSH")  # user@GPU_VPS_IP  (or fake://gpu)
+GPU_IMAGE = "nvidia/cuda:12.1-base"
+
+def _run_args(container_name: str, devices=None):
+    # devices diye ho to sirf wahi GPUs pin karo (scheduler), warna all
+    gpus = "all" if devices is None else '"device=%s"' % ",".join(map(str, devices))
+    return [
+        "run", "-d",
+        "--gpus", gpus,
         "--name", container_name,
         "--memory=4g",
-        "nvidia/cuda:12.1-base",
+        GPU_IMAGE,
         "sleep", "infinity"
     ]
-    subprocess.run(cmd, check=True)
 
-def gpu_docker_stop(container_name: str):
-    cmd = ["ssh", GPU_DOCKER_HOST, "docker", "rm", "-f", container_name]
-    subprocess.run(cmd, check=True)
+# pool sirf legacy single-host (--gpus all) mode ke liye; pinned pods cold start
+gpu_pool = register_pool(WarmPool("gpu", GPU_DOCKER_HOST, GPU_IMAGE, _run_args))
+
+def gpu_docker_run(container_name: str, host: str = None, devices=None):
+    get_host(host or GPU_DOCKER_HOST).docker(*_run_args(container_name, devices))
+
+def gpu_docker_stop(container_name: str, host: str = None):
+    get_host(host or GPU_DOCKER_HOST).docker("rm", "-f", container_name)
+
+# async variants (event loop / worker thread block nahi hota)
+async def gpu_docker_run_async(container_name: str, host: str = None, devices=None):
+    if devices is None and await gpu_pool.claim(container_name):
+        return
+    await get_host(host or GPU_DOCKER_HOST).adocker(*_run_args(container_name, devices))
+
+async def gpu_docker_stop_async(container_name: str, host: str = None):
+    await get_host(host or GPU_DOCKER_HOST).adocker("rm", "-f", container_name)
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.redis_client import r
+from app.db import SessionLocal
+from app.wallet import debit
+from app.rollups import add_usage
+from app.cpu_scheduler import start_cpu_container, stop_cpu_container
+from app.gpu_scheduler import start_gpu_container, stop_gpu_container
+from app.plans import load_active_plan
+from app.api_key_auth import get_user_from_api_key
+from app.rate_limit import rate_limit
+from app.pricing_engine import resolve_session_cost
+from app.session_index import register_session, unregister_session
+from app.biller import BILL_INTERVAL, asession_lock
+from app.logger import logger
+
+router = APIRouter(prefix="/fleet", tags=["Fleet"])
+
+# ==================================================
+# CONFIG
+# ==================================================
+# Fleet pod = ek alag billing session: {kind}:{user_id}:{pod_id}
+FLEET_MAX_BATCH = int(os.getenv("FLEET_MAX_BATCH", 200))
+FLEET_MAX_RUNNING = int(os.getenv("FLEET_MAX_RUNNING", 500))
+
+KINDS = ("cpu", "gpu")
+
+
+def _check_kind(kind: str):
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail="Unknown resource")
+
+
+def _pods_key(kind: str, user_id: int):
+    return f"fleet:{kind}:{user_id}"
+
+
+def _pod_key(kind: str, user_id: int, pod_id: str):
+    return f"{kind}:{user_id}:{pod_id}"
+
+
+def _ndjson(results):
+    async def stream():
+        async for item in results:
+            yield json.dumps(item) + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# ==================================================
+# INTERNAL: ONE POD
+# ==================================================
+async def _run_container(kind: str, user_id: int, plan, container_name: str):
+    # returns extra session fields (node placement)
+    if kind == "gpu":
+        return await start_gpu_container(user_id, plan, container_name)
+    return await start_cpu_container(container_name)
+
+
+async def _stop_container(kind: str, user_id: int, data: dict):
+    if kind == "gpu":
+        await asyncio.to_thread(stop_gpu_container, user_id, data)
+    else:
+        await asyncio.to_thread(stop_cpu_container, data)
+
+
+async def _start_pod(kind: str, user_id: int, plan, pod_id: str):
+    key = _pod_key(kind, user_id, pod_id)
+    container_name = f"cloudpod-{kind}-{user_id}-{pod_id}"
+
+    try:
+        placement = await _run_container(kind, user_id, plan, container_name)
+    except HTTPException as e:
+        r.srem(_pods_key(kind, user_id), pod_id)
+        return {"pod_id": pod_id, "error": e.detail}
+    except Exception as e:
+        r.srem(_pods_key(kind, user_id), pod_id)
+        logger.warning("[FLEET] start failed pod=%s err=%s", key, e)
+        return {"pod_id": pod_id, "error": "start failed"}
+
+    start = int(time.time())
+    r.hset(
+        key,
+        mapping={
+            "start": start,
+            "running": 1,
+            "container": container_name,
+            "billed": 0,
+            "accrued": 0,
+            **placement,
+        },
+    )
+    register_session(kind, key, start + BILL_INTERVAL)
+
+    return {"pod_id": pod_id, "container": container_name, "status": "started"}
+
+
+def _settle_pod(kind: str, user_id: int, pod_id: str, data: dict):
+    # _stop_cpu/_stop_gpu wala billing, per pod
+    minutes = max(1, (int(time.time()) - int(data.get("start", 0))) // 60)
+    billed = int(data.get("billed", 0))
+    accrued = float(data.get("accrued", 0))
+
+    cost = resolve_session_cost(user_id, kind, int(data.get("start", 0)), billed, minutes)
+
+    db = SessionLocal()
+    try:
+        label = f"{kind.upper()} fleet pod {pod_id} usage {minutes} min"
+        ok = debit(db, user_id, cost, label) if cost > 0 else True
+        if not ok:
+            return {
+                "pod_id": pod_id,
+                "error": "insufficient balance",
+                "minutes": minutes,
+                "cost": cost,
+            }
+
+        cost += accrued
+        add_usage(db, user_id, kind, minutes, cost)
+        db.commit()
+    finally:
+        db.close()
+
+    return {"pod_id": pod_id, "status": "stopped", "minutes": minutes, "cost": cost}
+
+
+async def _take_pod(kind: str, user_id: int, pod_id: str):
+    """Lock ke andar: container stop, phir session hatao; returns (data, error)."""
+    key = _pod_key(kind, user_id, pod_id)
+    # biller ka in-flight batch pehle khatam ho, taaki "billed" updated mile
+    async with asession_lock(key):
+        data = r.hgetall(key)
+        if not data or data.get("running") != "1":
+            r.srem(_pods_key(kind, user_id), pod_id)
+            return None, "not running"
+
+        # _stop_cpu_locked jaisa: stop fail ho to session rehta hai (billing
+        # chalti rahe, node load / devices held) - client retry kare
+        try:
+            await _stop_container(kind, user_id, data)
+        except Exception as e:
+            logger.warning("[FLEET] stop failed pod=%s err=%s", key, e)
+            return None, "stop failed"
+
+        r.delete(key)
+        unregister_session(kind, key)
+        r.srem(_pods_key(kind, user_id), pod_id)
+        return data, None
+
+
+async def _stop_pod(kind: str, user_id: int, pod_id: str):
+    try:
+        data, error = await _take_pod(kind, user_id, pod_id)
+    except HTTPException as e:
+        return {"pod_id": pod_id, "error": e.detail}
+
+    if error:
+        return {"pod_id": pod_id, "error": error}
+
+    return await asyncio.to_thread(_settle_pod, kind, user_id, pod_id, data)
+
+
+async def _fan_out(coros):
+    # jo pod pehle ready ho uska result pehle stream ho
+    for done in asyncio.as_completed(coros):
+        yield await done
+
+
+# ==================================================
+# FLEET ENDPOINTS (API KEY)
+# ==================================================
+@router.post("/{kind}/start")
+async def start_fleet(
+    kind: str,
+    count: int,
+    user_id: int = Depends(get_user_from_api_key),
+):
+    _check_kind(kind)
+    if not 1 <= count <= FLEET_MAX_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"count must be between 1 and {FLEET_MAX_BATCH}"
+        )
+
+    # ek batch = ek start request
+    rate_limit(f"fleet_start:{user_id}", limit=10, window=60)
+
+    pods_key = _pods_key(kind, user_id)
+    pod_ids = [uuid.uuid4().hex[:10] for _ in range(count)]
+    if r.scard(pods_key) + count > FLEET_MAX_RUNNING:
+        raise HTTPException(status_code=400, detail="Fleet pod limit reached")
+    r.sadd(pods_key, *pod_ids)
+
+    plan = await asyncio.to_thread(load_active_plan, user_id) if kind == "gpu" else None
+    return _ndjson(_fan_out([_start_pod(kind, user_id, plan, p) for p in pod_ids]))
+
+
+@router.post("/{kind}/stop")
+async def stop_fleet(
+    kind: str,
+    pod_ids: Optional[List[str]] = Body(default=None),
+    user_id: int = Depends(get_user_from_api_key),
+):
+    # pod_ids na diye to saare pods stop
+    _check_kind(kind)
+    if pod_ids is None:
+        pod_ids = list(r.smembers(_pods_key(kind, user_id)))
+
+    return _ndjson(_fan_out([_stop_pod(kind, user_id, p) for p in pod_ids]))
+
+
+@router.get("/{kind}")
+def list_fleet(
+    kind: str,
+    user_id: int = Depends(get_user_from_api_key),
+):
+    _check_kind(kind)
+    pod_ids = sorted(r.smembers(_pods_key(kind, user_id)))
+
+    pipe = r.pipeline(transaction=False)
+    for pod_id in pod_ids:
+        pipe.hgetall(_pod_key(kind, user_id, pod_id))
+
+    return [
+        {
+            "pod_id": pod_id,
+            "container": data.get("container"),
+            "start": int(data.get("start", 0)),
+            "billed_minutes": int(data.get("billed", 0)),
+        }
+        for pod_id, data in zip(pod_ids, pipe.execute())
+        if data.get("running") == "1"
+    ]
@@ -1,35 +1,30 @@
+import asyncio
 import time
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
 from app.redis_client import r
-from app.db import SessionLocal
+from app.db import get_db
 from app.wallet import debit
-from app.models import Usage
-from app.docker_gpu_client import gpu_docker_run, gpu_docker_stop
+from app.rollups import add_usage
+from app.gpu_scheduler import start_gpu_container, stop_gpu_container
+from app.plans import load_active_plan
 from app.deps import get_current_user
 from app.api_key_auth import get_user_from_api_key
 from app.rate_limit import rate_limit
-from app.pricing_engine import resolve_price
+from app.pricing_engine import resolve_session_cost
+from app.session_index import register_session, unregister_session
+from app.biller import BILL_INTERVAL, session_lock
 
 router = APIRouter(prefix="/gpu", tags=["GPU"])
 
-# ==================================================
-# DB DEPENDENCY
-# ==================================================
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ==================================================
 # INTERNAL START LOGIC
 # ==================================================
-def _start_gpu(user_id: int):
+async def _start_gpu(user_id: int, response: Response = None):
     # GPU stricter rate limit
-    rate_limit(f"gpu_start:{user_id}", limit=3, window=60)
+    limit = rate_limit(f"gpu_start:{user_id}", limit=3, window=60)
+    if response is not None:
+        limit.apply(response)
 
     key = f"gpu:{user_id}"
 
@@ -37,16 +32,24 @@ def _start_gpu(user_id: int):
         return {"error": "GPU already running"}
 
     container_name = f"cloudpod-gpu-{user_id}"
-    gpu_docker_run(container_name)
 
+    # placement: gpu_nodes me se node + device pin, plan.max_gpu enforce
+    plan = await asyncio.to_thread(load_active_plan, user_id)
+    placement = await start_gpu_container(user_id, plan, container_name)
+
+    start = int(time.time())
     r.hset(
         key,
         mapping={
-            "start": int(time.time()),
+            "start": start,
             "running": 1,
             "container": container_name,
+            "billed": 0,      # minutes already charged by biller
+            "accrued": 0,
+            **placement,
         },
     )
+    register_session("gpu", key, start + BILL_INTERVAL)
 
     return {
         "status": "GPU started",
@@ -60,25 +63,34 @@ def _start_gpu(user_id: int):
 # ==================================================
 def _stop_gpu(user_id: int, db):
     key = f"gpu:{user_id}"
+    # biller ka in-flight batch khatam hone do, phir updated "billed" padho;
+    # stop ke dauran biller is session ko skip karta hai
+    with session_lock(key):
+        return _stop_gpu_locked(user_id, key, db)
+
+
+def _stop_gpu_locked(user_id: int, key: str, db):
     data = r.hgetall(key)
 
     if not data or data.get("running") != "1":
         return {"error": "GPU not running"}
 
-    container = data.get("container")
-    if container:
-        gpu_docker_stop(container)
+    stop_gpu_container(user_id, data)
 
     start_time = int(data.get("start", 0))
     seconds = int(time.time()) - start_time
     minutes = max(1, seconds // 60)
 
-    # 🔥 PLAN / SUBSCRIPTION AWARE PRICING
-    price_per_min = resolve_price(user_id, "gpu")
-    cost = minutes * price_per_min
+    # biller already charged "billed" minutes; sirf baaki ka charge karo
+    billed = int(data.get("billed", 0))
+    accrued = float(data.get("accrued", 0))
+
+    # 🔥 PLAN / SUBSCRIPTION AWARE, TIME-OF-USE PRICING (minutes billed..minutes)
+    cost = resolve_session_cost(user_id, "gpu", start_time, billed, minutes)
 
-    ok = debit(db, user_id, cost, f"GPU usage {minutes} min")
+    ok = debit(db, user_id, cost, f"GPU usage {minutes} min") if cost > 0 else True
     r.delete(key)
+    unregister_session("gpu", key)
 
     if not ok:
         return {
@@ -87,15 +99,10 @@ def _stop_gpu(user_id: int, db):
             "cost": cost,
         }
 
-    # save usage
-    db.add(
-        Usage(
-            user_id=user_id,
-            resource="gpu",
-            minutes=minutes,
-            cost=cost,
-        )
-    )
+    cost += accrued
+
+    # save usage (+ daily/hourly rollups, same transaction)
+    add_usage(db, user_id, "gpu", minutes, cost)
     db.commit()
 
     return {
@@ -109,10 +116,11 @@ def _stop_gpu(user_id: int, db):
 # UI AUTH ENDPOINTS
 # ==================================================
 @router.post("/start")
-def start_gpu(
+async def start_gpu(
+    response: Response,
     user_id: int = Depends(get_current_user),
 ):
-    return _start_gpu(user_id)
+    return await _start_gpu(user_id, response)
 
 
 @router.post("/stop")
@@ -127,10 +135,11 @@ def stop_gpu(
 # API KEY ENDPOINTS (SDK / AUTOMATION)
 # ==================================================
 @router.post("/api/start")
-def start_gpu_api(
+async def start_gpu_api(
+    response: Response,
     user_id: int = Depends(get_user_from_api_key),
 ):
-    return _start_gpu(user_id)
+    return await _start_gpu(user_id, response)
 
 
 @router.post("/api/stop")
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.redis_client import r
+from app.db import SessionLocal
+from app.models import GPUNode
+from app.docker_gpu_client import gpu_docker_run_async, gpu_docker_stop
+from app.logger import logger
+
+# ==================================================
+# GPU PLACEMENT ENGINE (gpu_nodes)
+# ==================================================
+# Har node ke free device indices Redis set gpusched:free:{node_id} me;
+# allocate aur release Lua scripts se atomic hote hain (multi-worker safe).
+# Scheduler state apne "gpusched:" prefix me - "gpu:*" sirf session hashes
+# ke liye hai (biller rebuild_index unhe SCAN karta hai).
+# Node list DB se har GPU_NODE_REFRESH sec me reload hoti hai, isliye
+# naya gpu_nodes row bina redeploy ke capacity me aa jaata hai.
+GPU_PLACEMENT = os.getenv("GPU_PLACEMENT", "binpack")      # binpack / spread
+GPU_NODE_REFRESH = int(os.getenv("GPU_NODE_REFRESH", 30))
+# is priority se neeche wale plans har node ke last N GPUs nahi le sakte
+GPU_RESERVE_PRIORITY = int(os.getenv("GPU_RESERVE_PRIORITY", 2))
+GPU_PRIORITY_RESERVE = int(os.getenv("GPU_PRIORITY_RESERVE", 1))
+
+_ALLOCATE = r.register_script("""
+local n = tonumber(ARGV[1])
+local used = tonumber(redis.call('get', KEYS[3]) or '0')
+if used + n > tonumber(ARGV[2]) then
+    return -1
+end
+if redis.call('scard', KEYS[1]) < n + tonumber(ARGV[3]) then
+    return -2
+end
+local devices = redis.call('spop', KEYS[1], n)
+redis.call('sadd', KEYS[4], unpack(devices))
+redis.call('incrby', KEYS[3], n)
+redis.call('hset', KEYS[2], ARGV[4], ARGV[5] .. ':' .. table.concat(devices, ','))
+return devices
+""")
+
+# KEYS = used, alloc, free, busy, total (node ke); ARGV = container, node_id
+_RELEASE = r.register_script("""
+local alloc = redis.call('hget', KEYS[2], ARGV[1])
+if not alloc then
+    return 0
+end
+local sep = string.find(alloc, ':')
+if string.sub(alloc, 1, sep - 1) ~= ARGV[2] then
+    return -1
+end
+-- capacity ghat chuki ho to out-of-range device free set me wapas nahi
+local total = tonumber(redis.call('get', KEYS[5]) or '0')
+local n = 0
+for device in string.gmatch(string.sub(alloc, sep + 1), '[^,]+') do
+    redis.call('srem', KEYS[4], device)
+    if tonumber(device) < total then
+        redis.call('sadd', KEYS[3], device)
+    end
+    n = n + 1
+end
+redis.call('hdel', KEYS[2], ARGV[1])
+if redis.call('decrby', KEYS[1], n) <= 0 then
+    redis.call('del', KEYS[1])
+end
+return n
+""")
+
+# node capacity change: KEYS = total, free, busy; ARGV = new total.
+# Shrink par out-of-range indices free set se hatao; grow par sirf woh
+# indices add karo jo abhi allocated (busy) nahi hain.
+_RESIZE = r.register_script("""
+local old = tonumber(redis.call('get', KEYS[1]) or '0')
+local new = tonumber(ARGV[1])
+redis.call('set', KEYS[1], new)
+for i = new, old - 1 do
+    redis.call('srem', KEYS[2], i)
+end
+for i = old, new - 1 do
+    if redis.call('sismember', KEYS[3], i) == 0 then
+        redis.call('sadd', KEYS[2], i)
+    end
+end
+return old
+""")
+
+_RELEASE_LEGACY = r.register_script("""
+if redis.call('decrby', KEYS[1], ARGV[1]) <= 0 then
+    redis.call('del', KEYS[1])
+end
+return 1
+""")
+
+_nodes = {}          # node_id -> {"ssh_host", "gpu_type", "total_gpu"}
+_free = {}           # node_id -> free GPUs (last seen)
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _free_key(node_id):
+    return f"gpusched:free:{node_id}"
+
+
+def _alloc_key(user_id):
+    return f"gpusched:alloc:{user_id}"
+
+
+def _used_key(user_id):
+    return f"gpusched:used:{user_id}"
+
+
+def _total_key(node_id):
+    return f"gpusched:total:{node_id}"
+
+
+def _busy_key(node_id):
+    # abhi allocated device indices (capacity grow par dobara free na hon)
+    return f"gpusched:busy:{node_id}"
+
+
+_migrated = False
+
+
+def _migrate_keys():
+    # purane gpu:{free,alloc,used,total}:* keys -> gpusched:* (ek baar; RENAMENX
+    # isliye do workers saath chalein to bhi koi key overwrite nahi hoti)
+    for kind in ("free", "alloc", "used", "total"):
+        for key in r.scan_iter(match=f"gpu:{kind}:*", count=500):
+            r.renamenx(key, "gpusched" + key[len("gpu"):])
+
+    # busy sets allocations se reconcile (busy tracking se pehle ke pods)
+    for key in r.scan_iter(match=_alloc_key("*"), count=500):
+        for alloc in r.hvals(key):
+            node_id, devices = alloc.split(":", 1)
+            r.sadd(_busy_key(node_id), *devices.split(","))
+
+
+# ==================================================
+# NODE REGISTRY (DB -> MEMORY + REDIS)
+# ==================================================
+def refresh_nodes(force: bool = False):
+    global _nodes, _loaded_at, _migrated
+    with _lock:
+        if not force and time.time() - _loaded_at < GPU_NODE_REFRESH:
+            return _nodes
+
+        if not _migrated:
+            _migrate_keys()
+            _migrated = True
+
+        db = SessionLocal()
+        try:
+            rows = db.query(GPUNode).all()
+        finally:
+            db.close()
+
+        nodes = {}
+        for row in rows:
+            nodes[row.id] = {
+                "ssh_host": row.ssh_host,
+                "gpu_type": row.gpu_type,
+                "total_gpu": row.total_gpu or 0,
+            }
+            # capacity badli: free set resize (allocated devices chhod ke)
+            known = _RESIZE(
+                keys=[_total_key(row.id), _free_key(row.id), _busy_key(row.id)],
+                args=[nodes[row.id]["total_gpu"]],
+            )
+            if nodes[row.id]["total_gpu"] != known:
+                logger.info(
+                    "[GPU] node %s capacity %s -> %s",
+                    row.id, known, nodes[row.id]["total_gpu"]
+                )
+
+        _nodes = nodes
+        _loaded_at = time.time()
+        return _nodes
+
+
+def free_counts():
+    nodes = refresh_nodes()
+    pipe = r.pipeline(transaction=False)
+    for node_id in nodes:
+        pipe.scard(_free_key(node_id))
+    _free.clear()
+    _free.update(zip(nodes, pipe.execute()))
+    return dict(_free)
+
+
+# ==================================================
+# PLACEMENT
+# ==================================================
+def _candidates(free: dict, needed: int):
+    fits = [node_id for node_id, n in free.items() if n >= needed]
+    if GPU_PLACEMENT == "spread":
+        # sabse khaali node pehle
+        return sorted(fits, key=lambda node_id: -free[node_id])
+    # binpack: sabse bhara hua (kam free) node pehle, khaali nodes bache rahein
+    return sorted(fits, key=lambda node_id: free[node_id])
+
+
+def allocate(user_id: int, plan, container_name: str, gpus: int = 1):
+    """Devices reserve karo; returns (node_id, ssh_host, [device indices])."""
+    max_gpu = plan.max_gpu if plan and plan.max_gpu is not None else 0
+    priority = plan.priority if plan and plan.priority is not None else 0
+    reserve = GPU_PRIORITY_RESERVE if priority < GPU_RESERVE_PRIORITY else 0
+
+    free = free_counts()
+    for node_id in _candidates(free, gpus + reserve):
+        result = _ALLOCATE(
+            keys=[_free_key(node_id), _alloc_key(user_id), _used_key(user_id), _busy_key(node_id)],
+            args=[gpus, max_gpu, reserve, container_name, node_id],
+        )
+        if result == -1:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Plan GPU limit reached (max_gpu={max_gpu})"
+            )
+        if result == -2:
+            continue  # dusre worker ne le liye, agla node try karo
+        _free[node_id] = free[node_id] - gpus
+        return node_id, _nodes[node_id]["ssh_host"], sorted(int(d) for d in result)
+
+    raise HTTPException(status_code=503, detail="No GPU capacity available")
+
+
+def release(user_id: int, container_name: str, node_id):
+    _RELEASE(
+        keys=[
+            _used_key(user_id),
+            _alloc_key(user_id),
+            _free_key(node_id),
+            _busy_key(node_id),
+            _total_key(node_id),
+        ],
+        args=[container_name, node_id],
+    )
+
+
+def reserve_legacy(user_id: int, plan, gpus: int = 1):
+    # legacy host par devices track nahi hote, sirf per-user count (gpusched:used)
+    max_gpu = plan.max_gpu if plan and plan.max_gpu is not None else 0
+    if r.incrby(_used_key(user_id), gpus) > max_gpu:
+        r.decrby(_used_key(user_id), gpus)
+        raise HTTPException(
+            status_code=403,
+            detail=f"Plan GPU limit reached (max_gpu={max_gpu})"
+        )
+
+
+def release_legacy(user_id: int, gpus: int = 1):
+    _RELEASE_LEGACY(keys=[_used_key(user_id)], args=[gpus])
+
+
+# ==================================================
+# CONTAINER LIFECYCLE
+# ==================================================
+def has_nodes():
+    return bool(refresh_nodes())
+
+
+async def start_gpu_container(user_id: int, plan, container_name: str):
+    """Place + run; returns fields for the gpu session hash."""
+    # node refresh (DB query) + allocate (Redis) sync hain: event loop par nahi
+    if not await asyncio.to_thread(has_nodes):
+        # legacy single host (GPU_DOCKER_HOST_SSH, --gpus all); max_gpu yahan bhi
+        await asyncio.to_thread(reserve_legacy, user_id, plan)
+        try:
+            await gpu_docker_run_async(container_name)
+        except Exception:
+            await asyncio.to_thread(release_legacy, user_id)
+            raise
+        return {"legacy_gpus": 1}
+
+    node_id, host, devices = await asyncio.to_thread(allocate, user_id, plan, container_name)
+    try:
+        await gpu_docker_run_async(container_name, host=host, devices=devices)
+    except Exception:
+        await asyncio.to_thread(release, user_id, container_name, node_id)
+        raise
+
+    return {
+        "node_id": node_id,
+        "host": host,
+        "devices": ",".join(map(str, devices)),
+    }
+
+
+def stop_gpu_container(user_id: int, data: dict):
+    container = data.get("container")
+    if not container:
+        return
+    gpu_docker_stop(container, host=data.get("host"))
+    if data.get("node_id"):
+        release(user_id, container, data["node_id"])
+    elif data.get("legacy_gpus"):
+        release_legacy(user_id, int(data["legacy_gpus"]))
@@ -1,21 +1,23 @@
 # =========================
 # IMPORTS
 # =========================
+import asyncio
+import os
 import threading
 from fastapi import FastAPI, Request
 
 # =========================
 # DATABASE
 # =========================
-from app.db import engine
-from app.models import Base
+from app.db import AsyncSessionLocal, drop_indexes, engine, ensure_indexes, pool_gauges
+from app.models import Base, Subscription, Usage, WalletTransaction
 
 # =========================
 # ROUTERS
 # =========================
 from app.cpu import router as cpu_router
 from app.gpu import router as gpu_router
-from app.payments import router as payment_router
+from app.payments import router as payment_router, PaymentLog
 from app.admin import router as admin_router
 from app.admin_refund import router as refund_router
 from app.auth_routes import router as auth_router
@@ -24,14 +26,24 @@ from app.password_reset import router as password_reset_router
 from app.api_keys import router as api_keys_router
 from app.orgs import router as orgs_router
 from app.subscriptions import router as subscription_router
+from app.fleet import router as fleet_router
 
 # =========================
 # CORE SERVICES
 # =========================
-from app.biller import cpu_billing_loop
+from app.biller import run_worker
 from app.exceptions import global_exception_handler
 from app.seed_plans import seed_plans
-from app.wallet import get_balance
+from app.wallet import get_balance_async
+from app.metrics import snapshot
+from app.redis_client import r
+from app.warm_pool import refill_loop
+from app.api_key_auth import start_invalidation_listener
+from app.token_denylist import start_denylist_sync
+from app.api_key_store import ensure_schema as ensure_api_key_schema, migrate_legacy_keys
+from app.plans import ensure_schema as ensure_plan_schema
+from app.rollups import ensure_rollups
+from app.payment_worker import PAYMENT_WORKERS, start_payment_workers
 
 # =========================
 # APP INIT
@@ -45,6 +57,13 @@ app = FastAPI(
 # DATABASE INIT
 # =========================
 Base.metadata.create_all(bind=engine)
+ensure_api_key_schema()
+ensure_plan_schema()
+ensure_indexes(Usage, WalletTransaction, PaymentLog, Subscription)
+# rollups aane ke baad ye covering indexes koi read serve nahi karte
+drop_indexes("ix_usage_user_resource_created", "ix_usage_resource_created")
+# pehle deploy par purani history rollups me (baad ke starts par no-op)
+ensure_rollups()
 
 # =========================
 # STARTUP TASKS
@@ -54,12 +73,37 @@ def startup_tasks():
     # seed subscription plans
     seed_plans()
 
-    # start background billing thread
-    thread = threading.Thread(
-        target=cpu_billing_loop,
-        daemon=True
-    )
-    thread.start()
+    # plaintext API keys -> prefix + hash (idempotent)
+    migrate_legacy_keys()
+
+    # API key revoke -> sab workers ka auth cache invalidate
+    start_invalidation_listener()
+
+    # JWT logout / revocation denylist (bloom filter sync)
+    start_denylist_sync()
+
+    # webhooks sirf inbox me likhte hain; credits ye threads lagate hain
+    # (PAYMENT_WORKERS=0 + alag process: python -m app.payment_worker)
+    if PAYMENT_WORKERS > 0:
+        start_payment_workers()
+
+    # billing standalone workers karte hain: python -m app.biller --shard i/N
+    # (start.sh API ke saath ek biller chalata hai)
+    # local dev ke liye EMBEDDED_BILLER=1 se in-process worker (slot 0/1)
+    if os.getenv("EMBEDDED_BILLER") == "1":
+        thread = threading.Thread(
+            target=run_worker,
+            daemon=True
+        )
+        thread.start()
+
+
+@app.on_event("startup")
+async def start_warm_pool():
+    # pre-warmed containers (WARM_POOL=0 se band)
+    if os.getenv("WARM_POOL", "1") == "1":
+        # reference rakho, warna task GC ho sakta hai
+        app.state.refill_task = asyncio.create_task(refill_loop())
 
 # =========================
 # GLOBAL ERROR HANDLER
@@ -74,6 +118,7 @@ app.include_router(password_reset_router)
 
 app.include_router(cpu_router)
 app.include_router(gpu_router)
+app.include_router(fleet_router)
 
 app.include_router(payment_router)
 app.include_router(refund_router)
@@ -100,12 +145,24 @@ def root():
 # HEALTH CHECK
 # =========================
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
+# =========================
+# METRICS
+# =========================
+@app.get("/metrics")
+def metrics():
+    pool_gauges()
+    return {
+        "process": snapshot(),
+        "biller": r.hgetall("metrics:biller"),
+    }
+
 # =========================
 # WALLET BALANCE
 # =========================
 @app.get("/wallet")
-def wallet(user_id: int):
-    return {"balance": get_balance(user_id)}
+async def wallet(user_id: int):
+    async with AsyncSessionLocal() as db:
+        return {"balance": await get_balance_async(db, user_id)}
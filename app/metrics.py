@@ -0,0 +1,38 @@
+import threading
+
+# ==================================================
+# IN-PROCESS METRICS REGISTRY
+# ==================================================
+# Chhota sa registry: gauges, counters aur summaries (count/sum/max).
+# /metrics endpoint snapshot() expose karta hai.
+_lock = threading.Lock()
+_gauges = {}
+_counters = {}
+_summaries = {}
+
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def inc(name: str, amount: float = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name: str, value: float):
+    with _lock:
+        s = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        s["count"] += 1
+        s["sum"] += value
+        s["max"] = max(s["max"], value)
+
+
+def snapshot():
+    with _lock:
+        return {
+            "gauges": dict(_gauges),
+            "counters": dict(_counters),
+            "summaries": {k: dict(v) for k, v in _summaries.items()},
+        }
@@ -4,7 +4,9 @@ from sqlalchemy import (
     String,
     Float,
     Boolean,
-    DateTime
+    Date,
+    DateTime,
+    Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -37,6 +39,12 @@ class Usage(Base):
     cost = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # summaries rollups (usage_daily / usage_hourly) se aati hain, raw table
+    # par sirf history pages: (created_at, id) keyset per user
+    __table_args__ = (
+        Index("ix_usage_user_created", "user_id", "created_at", "id"),
+    )
+
 
 # ==================================================
 # WALLET TRANSACTIONS
@@ -50,6 +58,61 @@ class WalletTransaction(Base):
     reason = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # admin listing: (created_at, id) keyset, optional user filter
+    __table_args__ = (
+        Index("ix_wallet_txn_created", "created_at", "id"),
+        Index("ix_wallet_txn_user_created", "user_id", "created_at", "id"),
+    )
+
+
+# ==================================================
+# ROLLUPS (app.rollups - same txn me update hote hain)
+# ==================================================
+class UsageDaily(Base):
+    __tablename__ = "usage_daily"
+
+    user_id = Column(Integer, primary_key=True)
+    resource = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    minutes = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)
+    sessions = Column(Integer, default=0)
+
+
+class UsageHourly(Base):
+    __tablename__ = "usage_hourly"
+
+    user_id = Column(Integer, primary_key=True)
+    resource = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    minutes = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)
+    sessions = Column(Integer, default=0)
+
+
+# ledger rollups: shard = user_id % LEDGER_SHARDS, taaki har debit ek hi
+# "aaj" wali row par lock na le
+class LedgerDaily(Base):
+    __tablename__ = "ledger_daily"
+
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    credits = Column(Float, default=0.0)
+    debits = Column(Float, default=0.0)
+    credit_count = Column(Integer, default=0)
+    debit_count = Column(Integer, default=0)
+
+
+class LedgerHourly(Base):
+    __tablename__ = "ledger_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    credits = Column(Float, default=0.0)
+    debits = Column(Float, default=0.0)
+    credit_count = Column(Integer, default=0)
+    debit_count = Column(Integer, default=0)
+
 
 # ==================================================
 # GPU NODES (MULTI-GPU SCALE)
@@ -65,6 +128,20 @@ class GPUNode(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+# ==================================================
+# CPU NODES (MULTI-HOST CPU SCALE)
+# ==================================================
+class CPUNode(Base):
+    __tablename__ = "cpu_nodes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)               # node name
+    ssh_host = Column(String)           # user@ip
+    total_vcpu = Column(Float)
+    total_memory_mb = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 # ==================================================
 # PAYMENTS (IDEMPOTENCY)
 # ==================================================
@@ -97,7 +174,9 @@ class APIKey(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
-    key = Column(String, unique=True, index=True)
+    key = Column(String, unique=True, index=True)      # legacy plaintext (migrated -> NULL)
+    prefix = Column(String, unique=True, index=True)   # public lookup id
+    key_hash = Column(String)                          # HMAC-SHA256 of secret part
     active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -137,6 +216,7 @@ class Plan(Base):
     gpu_price_per_min = Column(Float)
     max_gpu = Column(Integer)
     priority = Column(Integer, default=0)   # higher = better
+    tariff = Column(String)                 # JSON time-of-use windows (app.pricing_engine)
 
 
 # ==================================================
@@ -151,3 +231,8 @@ class Subscription(Base):
     active = Column(Boolean, default=True)
     started_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime)
+
+    # renewal sweeper: active + due, expires_at order me
+    __table_args__ = (
+        Index("ix_subscriptions_active_expires", "active", "expires_at"),
+    )
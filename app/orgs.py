@@ -1,18 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.db import SessionLocal
+from app.db import get_db
 from app.models import Organization, OrgMember
 from app.deps import get_current_user
 
 router = APIRouter(prefix="/orgs", tags=["Organizations"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/create")
 def create_org(
     name: str,
@@ -0,0 +1,130 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, tuple_
+
+from app.db import AsyncSessionLocal, SessionLocal
+
+# ==================================================
+# KEYSET (CURSOR) PAGINATION
+# ==================================================
+# OFFSET nahi: har page index par (created_at, id) < last seen se seek karta
+# hai, isliye page 1 aur page 10,000 ka cost same. Cursor = opaque base64 JSON.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH = 1000
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if isinstance(col.type, DateTime) else v
+            for col, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(stmt, columns, cursor: str = None, desc: bool = True):
+    """columns = sort key, last one unique (id). Newest first by default."""
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        stmt = stmt.where(key < tuple_(*values) if desc else key > tuple_(*values))
+    order = [col.desc() if desc else col.asc() for col in columns]
+    return stmt.order_by(*order)
+
+
+def page(rows, limit: int, key_names):
+    # query limit + 1 ke saath chalao; extra row = aur pages hain
+    items = [dict(row._mapping) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1][name] for name in key_names])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# ==================================================
+# STREAMING EXPORT (NDJSON / CSV)
+# ==================================================
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _formatter(fmt: str, columns):
+    if fmt == "ndjson":
+        return None, lambda row: json.dumps({c: _plain(row[c]) for c in columns}) + "\n"
+
+    def csv_line(values):
+        buf = io.StringIO()
+        csv.writer(buf).writerow(values)
+        return buf.getvalue()
+
+    return csv_line(columns), lambda row: csv_line([_plain(row[c]) for c in columns])
+
+
+def stream_rows(stmt):
+    # sync server-side cursor; apna session (request wala stream se pehle band)
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH)
+        )
+        for row in result.mappings():
+            yield row
+    finally:
+        db.close()
+
+
+async def astream_rows(stmt):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH))
+        async for row in result.mappings():
+            yield row
+
+
+def export_response(rows, fmt: str, columns, filename: str):
+    """rows: sync ya async iterator of row mappings (server-side cursor se)."""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    header, line = _formatter(fmt, columns)
+
+    if hasattr(rows, "__aiter__"):
+        async def body():
+            if header:
+                yield header
+            async for row in rows:
+                yield line(row)
+    else:
+        def body():
+            if header:
+                yield header
+            for row in rows:
+                yield line(row)
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -1,22 +1,17 @@
 import uuid
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import SessionLocal
+from app.db import get_async_db, get_db
 from app.models import User, PasswordReset
-from app.auth import hash_password
+from app.auth import hash_password_async
 from app.email_service import send_email
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # =========================
 # FORGOT PASSWORD
 # =========================
@@ -52,20 +47,18 @@ def forgot_password(email: str, db: Session = Depends(get_db)):
 # RESET PASSWORD
 # =========================
 @router.post("/reset-password")
-def reset_password(token: str, new_password: str, db: Session = Depends(get_db)):
-    record = (
-        db.query(PasswordReset)
-        .filter(PasswordReset.token == token)
-        .first()
+async def reset_password(token: str, new_password: str, db: AsyncSession = Depends(get_async_db)):
+    record = await db.scalar(
+        select(PasswordReset).where(PasswordReset.token == token)
     )
 
     if not record or record.expires_at < datetime.utcnow():
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
-    user = db.query(User).filter(User.id == record.user_id).first()
-    user.password = hash_password(new_password)
+    user = await db.get(User, record.user_id)
+    user.password = await hash_password_async(new_password)
 
-    db.delete(record)
-    db.commit()
+    await db.delete(record)
+    await db.commit()
 
     return {"status": "password updated"}
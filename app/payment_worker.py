@@ -0,0 +1,179 @@
+import argparse
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from sqlalchemy import case, delete, select, update
+
+from app.db import SessionLocal
+from app.payments import PaymentInbox, PaymentLog, insert_ignore
+from app.wallet import credit_many
+from app.logger import logger
+from app.metrics import inc, observe
+
+# ==================================================
+# PAYMENT INBOX WORKER
+# ==================================================
+# payment_inbox ke pending rows batches me: FOR UPDATE SKIP LOCKED se claim,
+# phir ek transaction me PaymentLog insert (ON CONFLICT DO NOTHING = exactly
+# once gate) + credit_many + inbox status. Kai threads / processes parallel
+# chal sakte hain, ek hi payment do baar credit nahi hota.
+PAYMENT_WORKERS = int(os.getenv("PAYMENT_WORKERS", 1))
+PAYMENT_BATCH = int(os.getenv("PAYMENT_BATCH", 100))
+PAYMENT_POLL = float(os.getenv("PAYMENT_POLL", 0.5))          # inbox khaali ho to
+PAYMENT_MAX_ATTEMPTS = int(os.getenv("PAYMENT_MAX_ATTEMPTS", 5))
+
+REASONS = {
+    "razorpay": "UPI Payment (Razorpay {})",
+    "stripe": "Stripe Payment ({})",
+}
+
+
+def _claim(db, limit: int, ids=None):
+    stmt = select(
+        PaymentInbox.id,
+        PaymentInbox.provider,
+        PaymentInbox.reference_id,
+        PaymentInbox.user_id,
+        PaymentInbox.amount,
+        PaymentInbox.created_at,
+    ).where(PaymentInbox.status == "pending")
+    if ids is not None:
+        stmt = stmt.where(PaymentInbox.id.in_(ids))
+    return db.execute(
+        stmt.order_by(PaymentInbox.id).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+
+
+def _apply(db, rows, now: datetime):
+    """Claimed rows apply karo (commit caller karta hai); returns (applied, duplicate, failed)."""
+    fresh = set(db.scalars(
+        insert_ignore(
+            db.get_bind().dialect.name,
+            PaymentLog,
+            ["reference_id"],
+            [{"provider": row.provider, "reference_id": row.reference_id, "created_at": now} for row in rows],
+        ).returning(PaymentLog.reference_id)
+    ))
+
+    todo = [row for row in rows if row.reference_id in fresh]
+    credited = credit_many(db, [
+        (row.user_id, row.amount, REASONS.get(row.provider, "{}").format(row.reference_id))
+        for row in todo
+    ], commit=False)
+
+    # user hi nahi mila: PaymentLog hatao taaki baad me manually replay ho sake
+    failed = [row for row in todo if row.user_id not in credited]
+    if failed:
+        db.execute(delete(PaymentLog).where(
+            PaymentLog.reference_id.in_([row.reference_id for row in failed])
+        ))
+
+    status = {row.id: "duplicate" for row in rows if row.reference_id not in fresh}
+    status.update({row.id: "applied" for row in todo if row.user_id in credited})
+    status.update({row.id: "failed" for row in failed})
+
+    # bulk UPDATE by primary key (executemany)
+    db.execute(update(PaymentInbox), [
+        {
+            "id": row_id,
+            "status": value,
+            "error": "user not found" if value == "failed" else None,
+            "processed_at": now,
+        }
+        for row_id, value in status.items()
+    ])
+    return len(todo) - len(failed), len(rows) - len(todo), len(failed)
+
+
+def _record_error(db, row_id: int, error: str):
+    # retry baad me; PAYMENT_MAX_ATTEMPTS ke baad failed (manual dekhna)
+    attempts = PaymentInbox.attempts + 1
+    db.execute(
+        update(PaymentInbox)
+        .where(PaymentInbox.id == row_id)
+        .values(
+            attempts=attempts,
+            error=error[:500],
+            status=case((attempts >= PAYMENT_MAX_ATTEMPTS, "failed"), else_="pending"),
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+
+
+def _commit_batch(db, rows):
+    now = datetime.utcnow()
+    applied, duplicate, failed = _apply(db, rows, now)
+    db.commit()
+
+    inc("payments_applied_total", applied)
+    inc("payments_duplicate_total", duplicate)
+    inc("payments_failed_total", failed)
+    # webhook ack -> wallet credit tak ka lag
+    observe("payments_inbox_lag_seconds", max((now - row.created_at).total_seconds() for row in rows))
+
+
+def apply_batch(db, limit: int = PAYMENT_BATCH):
+    """Ek batch process karo; returns claimed rows count."""
+    rows = _claim(db, limit)
+    if not rows:
+        db.rollback()
+        return 0
+
+    try:
+        _commit_batch(db, rows)
+        return len(rows)
+    except Exception:
+        db.rollback()
+        logger.error("[PAYMENTS] batch error, retrying rows one by one\n%s", traceback.format_exc())
+
+    # ek kharab row poore batch ko na roke
+    for row_id in [row.id for row in rows]:
+        single = _claim(db, 1, [row_id])
+        if not single:
+            db.rollback()
+            continue
+        try:
+            _commit_batch(db, single)
+        except Exception as e:
+            db.rollback()
+            _record_error(db, row_id, repr(e))
+    return len(rows)
+
+
+def _loop():
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                if apply_batch(db) < PAYMENT_BATCH:
+                    time.sleep(PAYMENT_POLL)
+            except Exception:
+                db.rollback()
+                logger.error("[PAYMENTS] worker error\n%s", traceback.format_exc())
+                time.sleep(PAYMENT_POLL)
+    finally:
+        db.close()
+
+
+def start_payment_workers(n: int = PAYMENT_WORKERS):
+    threads = []
+    for i in range(n):
+        thread = threading.Thread(target=_loop, name=f"payment-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+if __name__ == "__main__":
+    # python -m app.payment_worker --workers 4   (API se alag chalana ho to)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=PAYMENT_WORKERS)
+    args = parser.parse_args()
+
+    logger.info("[PAYMENTS] %s inbox workers started", args.workers)
+    for thread in start_payment_workers(max(args.workers, 1)):
+        thread.join()
@@ -5,11 +5,11 @@ import stripe
 from datetime import datetime
 
 from fastapi import APIRouter, Request, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Column, Integer, Float, String, DateTime, Index, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
 
-from app.db import SessionLocal
-from app.wallet import credit
+from app.db import get_async_db
 from app.models import Base
 
 # ==================================================
@@ -18,17 +18,6 @@ from app.models import Base
 router = APIRouter(prefix="/payment", tags=["Payment"])
 
 
-# ==================================================
-# DB DEPENDENCY
-# ==================================================
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ==================================================
 # PAYMENT LOG (IDEMPOTENCY TABLE)
 # ==================================================
@@ -40,6 +29,72 @@ class PaymentLog(Base):
     reference_id = Column(String, unique=True)     # payment_id / session_id
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # admin listing: (created_at, id) keyset, optional provider filter
+    __table_args__ = (
+        Index("ix_payment_logs_created", "created_at", "id"),
+        Index("ix_payment_logs_provider_created", "provider", "created_at", "id"),
+    )
+
+
+# ==================================================
+# PAYMENT INBOX (DURABLE WEBHOOK QUEUE)
+# ==================================================
+# Webhook sirf verify + ek INSERT .. ON CONFLICT DO NOTHING karke turant ack
+# karta hai; wallet credit app.payment_worker batches me lagata hai. Gateway
+# retries (same provider + reference_id) yahin dedupe ho jaate hain.
+class PaymentInbox(Base):
+    __tablename__ = "payment_inbox"
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String, nullable=False)
+    reference_id = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False)
+    status = Column(String, default="pending")     # pending / applied / duplicate / failed
+    attempts = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("provider", "reference_id", name="uq_payment_inbox_ref"),
+        # worker poll: WHERE status = 'pending' ORDER BY id
+        Index("ix_payment_inbox_status", "status", "id"),
+    )
+
+
+def insert_ignore(dialect: str, model, keys, rows):
+    # INSERT .. ON CONFLICT (keys) DO NOTHING
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    return insert(model.__table__).values(rows).on_conflict_do_nothing(index_elements=keys)
+
+
+async def enqueue_payment(db: AsyncSession, provider: str, reference_id: str, user_id, amount: float):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return {"error": "invalid user_id"}
+
+    result = await db.execute(insert_ignore(
+        db.get_bind().dialect.name,
+        PaymentInbox,
+        ["provider", "reference_id"],
+        [{
+            "provider": provider,
+            "reference_id": reference_id,
+            "user_id": user_id,
+            "amount": amount,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+        }],
+    ))
+    await db.commit()
+
+    if result.rowcount == 0:
+        return {"status": "already received"}
+    return {"status": "accepted"}
+
 
 # ==================================================
 # RAZORPAY SIGNATURE VERIFY
@@ -64,7 +119,7 @@ def verify_razorpay_signature(body: bytes, signature: str) -> bool:
 @router.post("/webhook")
 async def razorpay_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     body = await request.body()
     payload = await request.json()
@@ -86,31 +141,8 @@ async def razorpay_webhook(
     if not user_id:
         return {"error": "user_id missing"}
 
-    # -------- IDEMPOTENCY CHECK --------
-    exists = db.query(PaymentLog).filter_by(
-        provider="razorpay",
-        reference_id=payment_id
-    ).first()
-
-    if exists:
-        return {"status": "already processed"}
-
-    # wallet credit
-    credit(
-        db=db,
-        user_id=int(user_id),
-        amount=amount,
-        reason=f"UPI Payment (Razorpay {payment_id})"
-    )
-
-    # save payment log
-    db.add(PaymentLog(
-        provider="razorpay",
-        reference_id=payment_id
-    ))
-    db.commit()
-
-    return {"status": "wallet credited"}
+    # durable inbox; credit payment_worker lagata hai
+    return await enqueue_payment(db, "razorpay", payment_id, user_id, amount)
 
 
 # ==================================================
@@ -119,7 +151,7 @@ async def razorpay_webhook(
 @router.post("/stripe-webhook")
 async def stripe_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     payload = await request.body()
     sig = request.headers.get("Stripe-Signature")
@@ -146,28 +178,4 @@ async def stripe_webhook(
     if not user_id:
         return {"error": "user_id missing"}
 
-    # -------- IDEMPOTENCY CHECK --------
-    exists = db.query(PaymentLog).filter_by(
-        provider="stripe",
-        reference_id=payment_id
-    ).first()
-
-    if exists:
-        return {"status": "already processed"}
-
-    # wallet credit
-    credit(
-        db=db,
-        user_id=int(user_id),
-        amount=amount,
-        reason=f"Stripe Payment ({payment_id})"
-    )
-
-    # save payment log
-    db.add(PaymentLog(
-        provider="stripe",
-        reference_id=payment_id
-    ))
-    db.commit()
-
-    return {"status": "wallet credited"}
+    return await enqueue_payment(db, "stripe", payment_id, user_id, amount)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import inspect, select, text
+
+from app.db import SessionLocal, engine
+from app.models import Plan, Subscription
+from app.redis_client import r
+
+# ==================================================
+# PLAN CATALOG (PER-PROCESS CACHE)
+# ==================================================
+# plans table chhoti hai: process me ek baar load, phir har PLAN_VERSION_CHECK
+# sec me sirf Redis "plans:version" compare hota hai. Plan change hone par
+# invalidate_plans() version badhata hai -> sab workers reload karte hain.
+PLAN_VERSION_CHECK = int(os.getenv("PLAN_VERSION_CHECK", 30))
+PLAN_USER_TTL = int(os.getenv("PLAN_USER_TTL", 3600))
+PLANS_VERSION_KEY = "plans:version"
+
+PLAN_FIELDS = (
+    "id",
+    "name",
+    "monthly_price",
+    "cpu_price_per_min",
+    "gpu_price_per_min",
+    "max_gpu",
+    "priority",
+    "tariff",
+)
+
+_catalog = {}        # plan_id -> SimpleNamespace (Plan jaisa, detached)
+_etag = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def ensure_schema():
+    # create_all purani table me columns add nahi karta
+    columns = {c["name"] for c in inspect(engine).get_columns("plans")}
+    if "tariff" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE plans ADD COLUMN tariff VARCHAR"))
+
+
+def _load_catalog():
+    global _catalog, _etag
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(*[getattr(Plan, f) for f in PLAN_FIELDS]).order_by(Plan.id)
+        ).all()
+    finally:
+        db.close()
+
+    plans = [dict(row._mapping) for row in rows]
+    for p in plans:
+        # NULL = default tariff (peak 18–23 UTC)
+        p["tariff"] = json.loads(p["tariff"]) if p["tariff"] else None
+    _catalog = {p["id"]: SimpleNamespace(**p) for p in plans}
+    _etag = '"%s"' % hashlib.sha1(json.dumps(plans, sort_keys=True).encode()).hexdigest()
+
+
+def _refresh():
+    global _version, _checked_at
+    if time.time() - _checked_at < PLAN_VERSION_CHECK and _etag is not None:
+        return
+    with _lock:
+        if time.time() - _checked_at < PLAN_VERSION_CHECK and _etag is not None:
+            return
+        version = r.get(PLANS_VERSION_KEY)
+        if _etag is None or version != _version:
+            _load_catalog()
+            _version = version
+        _checked_at = time.time()
+
+
+def plan_catalog():
+    _refresh()
+    return _catalog
+
+
+def catalog_etag():
+    _refresh()
+    return _etag
+
+
+def get_plan(plan_id: int):
+    return plan_catalog().get(plan_id)
+
+
+def default_plan():
+    # subscription nahi -> sabse basic (lowest priority) plan
+    plans = plan_catalog().values()
+    return min(plans, key=lambda p: (p.priority or 0, p.id), default=None)
+
+
+def invalidate_plans():
+    global _checked_at
+    r.incr(PLANS_VERSION_KEY)
+    _checked_at = 0.0
+
+
+# ==================================================
+# USER -> ACTIVE PLAN (REDIS CACHE)
+# ==================================================
+# plan:user:{user_id} = plan_id ("0" = koi active subscription nahi).
+# /subscription/subscribe (aur expiry) invalidate_user_plan() call karte hain.
+# plan:gen:{user_id} har invalidate par badhta hai; cache fill sirf tab SET
+# karta hai jab DB read ke dauran gen nahi badla (warna purana plan wapas
+# cache me likh dete).
+def _user_key(user_id: int):
+    return f"plan:user:{user_id}"
+
+
+def _gen_key(user_id: int):
+    return f"plan:gen:{user_id}"
+
+
+# KEYS = [cache1, gen1, cache2, gen2, ...], ARGV = [ttl, gen1, plan1, gen2, plan2, ...]
+_FILL = r.register_script("""
+for i = 1, #KEYS, 2 do
+    local j = i + 1
+    if (redis.call('get', KEYS[i + 1]) or '0') == ARGV[j] then
+        redis.call('set', KEYS[i], ARGV[j + 1], 'EX', ARGV[1])
+    end
+end
+return 1
+""")
+
+
+def _active_plan_ids(user_ids):
+    # latest active subscription per user; ek query poore batch ke liye
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Subscription.user_id, Subscription.plan_id)
+            .where(
+                Subscription.user_id.in_(user_ids),
+                Subscription.active == True
+            )
+            .order_by(Subscription.started_at.asc())
+        ).all()
+    finally:
+        db.close()
+    return {user_id: plan_id for user_id, plan_id in rows}
+
+
+def user_plans(user_ids):
+    """{user_id: plan}; warm path = ek Redis MGET, koi DB query nahi."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+
+    cached = r.mget([_user_key(u) for u in user_ids])
+    plan_ids = {u: int(v) for u, v in zip(user_ids, cached) if v is not None}
+
+    missing = [u for u in user_ids if u not in plan_ids]
+    if missing:
+        # gen DB read se pehle; beech me invalidate hua to fill skip
+        gens = r.mget([_gen_key(u) for u in missing])
+        found = _active_plan_ids(missing)
+        keys, args = [], [PLAN_USER_TTL]
+        for user_id, gen in zip(missing, gens):
+            plan_ids[user_id] = found.get(user_id) or 0
+            keys += [_user_key(user_id), _gen_key(user_id)]
+            args += [gen or "0", plan_ids[user_id]]
+        _FILL(keys=keys, args=args)
+
+    fallback = default_plan()
+    return {
+        user_id: get_plan(plan_id) or fallback
+        for user_id, plan_id in plan_ids.items()
+    }
+
+
+def load_active_plan(user_id: int):
+    return user_plans([user_id])[user_id]
+
+
+def invalidate_user_plan(*user_ids):
+    if not user_ids:
+        return
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(*[_user_key(u) for u in user_ids])
+    for user_id in user_ids:
+        pipe.incr(_gen_key(user_id))
+        # in-flight fills (ms) se kaafi lamba
+        pipe.expire(_gen_key(user_id), PLAN_USER_TTL)
+    pipe.execute()
+
+
+if __name__ == "__main__":
+    # python -m app.plans reload   (plans table haath se badli ho to)
+    if sys.argv[1:] != ["reload"]:
+        sys.exit("usage: python -m app.plans reload")
+    invalidate_plans()
+    print("plan catalog version bumped")
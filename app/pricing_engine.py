@@ -1,15 +1,149 @@
-from datetime import datetime
+import json
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+
 from app.models import Plan
+from app.plans import load_active_plan
+from app.pricing import CPU_PRICE_PER_MIN, GPU_PRICE_PER_MIN
+
+# plans table khaali ho to flat default rates
+FALLBACK_PRICES = {"cpu": CPU_PRICE_PER_MIN, "gpu": GPU_PRICE_PER_MIN}
+
+# ==================================================
+# TIME-OF-USE TARIFFS
+# ==================================================
+# Plan.tariff (JSON) = windows list, UTC:
+#   [{"from": "18:00", "to": "24:00", "multiplier": 1.2, "days": [0, 1, 2, 3, 4]}]
+# days = weekday (0 = Monday), na diya to roz. Window ke bahar multiplier 1.0.
+# Tariff hafte bhar ki breakpoints + prefix sums me compile hota hai, isliye
+# kisi bhi [t0, t1) ka cost do bisect lookups hai - session kitna bhi lamba ho.
+DEFAULT_TARIFF = [{"from": "18:00", "to": "24:00", "multiplier": 1.2}]   # peak 18–23 UTC
+
+WEEK = 7 * 86400
+_EPOCH_WEEKDAY = 3          # 1970-01-01 = Thursday
+
+_compiled = {}              # tariff json -> (bounds, rates, cum)
+
+
+def _seconds(hhmm: str):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+def _compile(tariff):
+    # week ko second-of-week segments me todo; overlapping windows multiply
+    edges = {0, WEEK}
+    windows = []
+    for w in tariff:
+        start, end = _seconds(w["from"]), _seconds(w["to"])
+        if end <= start:
+            end += 86400            # "22:00" -> "02:00" midnight cross karta hai
+        for day in w.get("days", range(7)):
+            a, b = day * 86400 + start, day * 86400 + end
+            # Sunday raat wala window agle hafte ke Monday me wrap
+            parts = [(a, min(b, WEEK))] + ([(0, b - WEEK)] if b > WEEK else [])
+            for a, b in parts:
+                windows.append((a, b, float(w["multiplier"])))
+                edges.update((a, b))
+
+    bounds = sorted(edges)
+    rates = []
+    for a in bounds[:-1]:
+        rate = 1.0
+        for start, end, multiplier in windows:
+            if start <= a < end:
+                rate *= multiplier
+        rates.append(rate)
+
+    cum = [0.0]
+    for i, rate in enumerate(rates):
+        cum.append(cum[-1] + rate * (bounds[i + 1] - bounds[i]))
+    return bounds, rates, cum
+
+
+def compiled_tariff(tariff=None):
+    tariff = DEFAULT_TARIFF if tariff is None else tariff
+    key = json.dumps(tariff, sort_keys=True)
+    if key not in _compiled:
+        _compiled[key] = _compile(tariff)
+    return _compiled[key]
+
 
-def resolve_price(plan: Plan, resource: str):
-    hour = datetime.utcnow().hour
+def _weighted_seconds(compiled, t: float):
+    # integral of multiplier from epoch-week start to t (seconds)
+    bounds, rates, cum = compiled
+    t += _EPOCH_WEEKDAY * 86400
+    weeks, offset = divmod(t, WEEK)
+    i = bisect_right(bounds, offset) - 1
+    return weeks * cum[-1] + cum[i] + rates[i] * (offset - bounds[i])
 
-    # peak hours (18–23 UTC)
-    multiplier = 1.2 if 18 <= hour <= 23 else 1.0
 
+def _base_price(plan: Plan, resource: str):
+    # plan me is resource ka price set hi nahi (NULL / plan nahi) -> flat default
+    # rate. 0 = jaan-boojh kar free, woh free hi rahe
+    price = None
     if resource == "cpu":
-        return plan.cpu_price_per_min * multiplier
-    if resource == "gpu":
-        return plan.gpu_price_per_min * multiplier
+        price = getattr(plan, "cpu_price_per_min", None)
+    elif resource == "gpu":
+        price = getattr(plan, "gpu_price_per_min", None)
+    return FALLBACK_PRICES.get(resource, 0) if price is None else price
+
+
+def _plan_tariff(plan: Plan):
+    return compiled_tariff(getattr(plan, "tariff", None) if plan is not None else None)
+
+
+# ==================================================
+# PRICING API
+# ==================================================
+def invoice_many(items):
+    """Bulk invoice: items = [(plan, resource, t0, t1)] epoch seconds.
+
+    Returns costs list (same order). Per item O(log segments).
+    """
+    costs = []
+    tariffs = {}        # id(plan) -> compiled; batch me plans gine-chune hote hain
+    for plan, resource, t0, t1 in items:
+        base = _base_price(plan, resource)
+        if not base or t1 <= t0:
+            costs.append(0.0)
+            continue
+        compiled = tariffs.get(id(plan))
+        if compiled is None:
+            compiled = tariffs[id(plan)] = _plan_tariff(plan)
+        weighted = _weighted_seconds(compiled, t1) - _weighted_seconds(compiled, t0)
+        costs.append(base * weighted / 60)
+    return costs
+
+
+def session_cost(plan: Plan, resource: str, start: int, from_minute: int, to_minute: int):
+    # session ke minutes [from_minute, to_minute) - biller aur stop dono yahi use karte hain
+    return invoice_many([
+        (plan, resource, start + from_minute * 60, start + to_minute * 60)
+    ])[0]
+
+
+def _epoch(at: datetime = None):
+    # naive datetimes = UTC (repo me utcnow hi use hota hai)
+    if at is None:
+        return time.time()
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+def plan_price(plan: Plan, resource: str, at: datetime = None):
+    # instantaneous per-minute rate (display / estimates)
+    bounds, rates, _ = _plan_tariff(plan)
+    offset = (_epoch(at) + _EPOCH_WEEKDAY * 86400) % WEEK
+    return _base_price(plan, resource) * rates[bisect_right(bounds, offset) - 1]
+
+
+def resolve_price(user_id: int, resource: str, at: datetime = None):
+    # user ka active plan cache se (plans.user_plans), DB tabhi jab cache miss
+    return plan_price(load_active_plan(user_id), resource, at)
+
 
-    return 0
+def resolve_session_cost(user_id: int, resource: str, start: int, from_minute: int, to_minute: int):
+    return session_cost(load_active_plan(user_id), resource, start, from_minute, to_minute)
@@ -1,17 +1,126 @@
+import math
+import os
+import threading
 import time
-from fastapi import HTTPException
+
+from fastapi import HTTPException, Request, Response
 from app.redis_client import r
+from app.cache import TTLCache
+
+# ==================================================
+# GCRA RATE LIMITER (ONE LUA CALL PER CHECK)
+# ==================================================
+# Generic cell rate algorithm: key ke liye sirf "theoretical arrival time"
+# (TAT) store hota hai. Sliding behaviour, window boundary par 2x burst nahi.
+# Clock Redis TIME se, taaki workers ke clock skew se farak na pade.
+_GCRA = r.register_script("""
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+local tat = tonumber(redis.call('get', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - burst * interval
+if now < allow_at then
+    return {0, 0, allow_at - now, tat - now}
+end
+redis.call('set', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, math.floor((now - allow_at) / interval), 0, new_tat - now}
+""")
+
+# local token bucket: ek worker akele hi limit cross kar de to Redis tak
+# jaane ki zarurat nahi (global limit to pakka cross ho chuka hai)
+RATE_LIMIT_LOCAL = os.getenv("RATE_LIMIT_LOCAL", "1") == "1"
+_buckets = TTLCache(maxsize=50000, ttl=3600)
+_buckets_lock = threading.Lock()
+
+
+class RateLimitResult:
+    def __init__(self, limit: int, allowed: bool, remaining: int, retry_after: float, reset_after: float):
+        self.limit = limit
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after    # seconds
+        self.reset_after = reset_after    # seconds until fully replenished
+
+    def headers(self):
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, self.remaining)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+    def apply(self, response: Response):
+        response.headers.update(self.headers())
+
+
+def _local_take(key: str, limit: int, window: int):
+    rate = limit / window
+    now = time.monotonic()
+    with _buckets_lock:
+        tokens, last = _buckets.get(key, (float(limit), now))
+        tokens = min(float(limit), tokens + (now - last) * rate)
+        if tokens < 1:
+            _buckets.set(key, (tokens, now), ttl=window)
+            return RateLimitResult(limit, False, 0, (1 - tokens) / rate, window)
+        _buckets.set(key, (tokens - 1, now), ttl=window)
+        return None
 
-def rate_limit(key: str, limit: int, window: int):
-    now = int(time.time())
-    redis_key = f"rate:{key}:{now // window}"
 
-    count = r.incr(redis_key)
-    if count == 1:
-        r.expire(redis_key, window)
+def check(key: str, limit: int, window: int) -> RateLimitResult:
+    if RATE_LIMIT_LOCAL:
+        rejected = _local_take(key, limit, window)
+        if rejected is not None:
+            return rejected
 
-    if count > limit:
+    # integer ms: Lua SET .. PX float reject karta hai (e.g. 7 / 60s)
+    interval_ms = math.ceil(window * 1000 / limit)
+    allowed, remaining, retry_ms, reset_ms = _GCRA(
+        keys=[f"rate:{key}"],
+        args=[interval_ms, limit],
+    )
+    return RateLimitResult(limit, bool(allowed), int(remaining), retry_ms / 1000, reset_ms / 1000)
+
+
+def rate_limit(key: str, limit: int, window: int):
+    result = check(key, limit, window)
+    if not result.allowed:
         raise HTTPException(
             status_code=429,
-            detail="Too many requests"
+            detail="Too many requests",
+            headers=result.headers()
+        )
+    return result
+
+
+# ==================================================
+# ROUTE DEPENDENCY
+# ==================================================
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """Depends(RateLimit("login", limit=10, window=60)) - default key = client IP."""
+
+    def __init__(self, name: str, limit: int, window: int, key_func=client_ip):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.key_func = key_func
+
+    def __call__(self, request: Request, response: Response):
+        result = rate_limit(
+            f"{self.name}:{self.key_func(request)}",
+            self.limit,
+            self.window
         )
+        result.apply(response)
+        return result
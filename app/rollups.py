@@ -0,0 +1,261 @@
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.db import SessionLocal
+from app.models import (
+    LedgerDaily,
+    LedgerHourly,
+    Usage,
+    UsageDaily,
+    UsageHourly,
+    WalletTransaction,
+)
+from app.logger import logger
+
+# ==================================================
+# USAGE + LEDGER ROLLUPS
+# ==================================================
+# Raw rows (usage, wallet_transactions) ke saath hi, usi transaction me,
+# per-day aur per-hour buckets me additive upsert. Summary / revenue
+# endpoints O(days) rows padhte hain, poori history nahi.
+LEDGER_SHARDS = int(os.getenv("LEDGER_SHARDS", 16))
+
+
+def _hour(at: datetime):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(dialect: str, model, keys, rows):
+    # INSERT .. ON CONFLICT (keys) DO UPDATE SET col = col + excluded.col
+    table = model.__table__
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            col: table.c[col] + stmt.excluded[col]
+            for col in rows[0] if col not in keys
+        },
+    )
+
+
+def _bucket_stmts(dialect, model, keys, buckets):
+    if not buckets:
+        return []
+    # sorted order: do transactions same rows ko ulte order me lock na karein
+    rows = [dict(zip(keys, key), **values) for key, values in sorted(buckets.items())]
+    return [_upsert(dialect, model, keys, rows)]
+
+
+def usage_stmts(dialect: str, entries):
+    """entries: [(user_id, resource, minutes, cost, at)]"""
+    daily = defaultdict(lambda: {"minutes": 0, "cost": 0.0, "sessions": 0})
+    hourly = defaultdict(lambda: {"minutes": 0, "cost": 0.0, "sessions": 0})
+    for user_id, resource, minutes, cost, at in entries:
+        for bucket in (daily[(user_id, resource, at.date())], hourly[(user_id, resource, _hour(at))]):
+            bucket["minutes"] += minutes or 0
+            bucket["cost"] += cost or 0
+            bucket["sessions"] += 1
+
+    return (
+        _bucket_stmts(dialect, UsageDaily, ["user_id", "resource", "day"], daily)
+        + _bucket_stmts(dialect, UsageHourly, ["user_id", "resource", "hour"], hourly)
+    )
+
+
+def ledger_stmts(dialect: str, entries):
+    """entries: [(user_id, amount, at)]  (+credit / -debit)"""
+    zero = lambda: {"credits": 0.0, "debits": 0.0, "credit_count": 0, "debit_count": 0}
+    daily, hourly = defaultdict(zero), defaultdict(zero)
+    for user_id, amount, at in entries:
+        shard = user_id % LEDGER_SHARDS
+        for bucket in (daily[(at.date(), shard)], hourly[(_hour(at), shard)]):
+            if amount >= 0:
+                bucket["credits"] += amount
+                bucket["credit_count"] += 1
+            else:
+                bucket["debits"] += -amount
+                bucket["debit_count"] += 1
+
+    return (
+        _bucket_stmts(dialect, LedgerDaily, ["day", "shard"], daily)
+        + _bucket_stmts(dialect, LedgerHourly, ["hour", "shard"], hourly)
+    )
+
+
+def _dialect(db):
+    return db.get_bind().dialect.name
+
+
+def record_usage(db, entries):
+    for stmt in usage_stmts(_dialect(db), entries):
+        db.execute(stmt)
+
+
+def record_ledger(db, entries):
+    for stmt in ledger_stmts(_dialect(db), entries):
+        db.execute(stmt)
+
+
+async def record_ledger_async(db, entries):
+    for stmt in ledger_stmts(_dialect(db), entries):
+        await db.execute(stmt)
+
+
+def add_usage(db, user_id: int, resource: str, minutes: int, cost: float):
+    # Usage row + rollups; commit caller karta hai
+    now = datetime.utcnow()
+    db.add(Usage(
+        user_id=user_id,
+        resource=resource,
+        minutes=minutes,
+        cost=cost,
+        created_at=now
+    ))
+    record_usage(db, [(user_id, resource, minutes, cost, now)])
+
+
+# ==================================================
+# READ SIDE
+# ==================================================
+def _day_aligned(*bounds):
+    return all(t is None or t == _hour(t) and t.hour == 0 for t in bounds)
+
+
+def _range(stmt, daily_col, hourly_col, start, end):
+    # midnight-aligned range -> daily table, warna hourly (hour granularity)
+    if _day_aligned(start, end):
+        col, start, end = daily_col, start and start.date(), end and end.date()
+    else:
+        col, start = hourly_col, start and _hour(start)
+    if start is not None:
+        stmt = stmt.where(col >= start)
+    if end is not None:
+        stmt = stmt.where(col < end)
+    return stmt
+
+
+def usage_by_resource(user_id: int = None, start: datetime = None, end: datetime = None):
+    """rows: (resource, cost, minutes)"""
+    model = UsageDaily if _day_aligned(start, end) else UsageHourly
+    stmt = select(model.resource, func.sum(model.cost), func.sum(model.minutes))
+    if user_id is not None:
+        stmt = stmt.where(model.user_id == user_id)
+    stmt = _range(stmt, UsageDaily.day, UsageHourly.hour, start, end)
+    return stmt.group_by(model.resource)
+
+
+def revenue_total(start: datetime = None, end: datetime = None):
+    model = LedgerDaily if _day_aligned(start, end) else LedgerHourly
+    stmt = select(func.sum(model.credits))
+    return _range(stmt, LedgerDaily.day, LedgerHourly.hour, start, end)
+
+
+# ==================================================
+# BACKFILL (RAW LEDGER -> ROLLUPS)
+# ==================================================
+ROLLUP_MODELS = (UsageDaily, UsageHourly, LedgerDaily, LedgerHourly)
+
+
+def _lock_rollups(db):
+    # live writers raw row + rollup upsert ek transaction me karte hain; rollup
+    # tables EXCLUSIVE lock hone par unka upsert (aur commit) rebuild khatam hone
+    # tak rukta hai, isliye koi row na chhoot-ti hai na do baar gini jaati hai.
+    # SQLite: write transaction already exclusive hai.
+    if _dialect(db) == "postgresql":
+        tables = ", ".join(model.__tablename__ for model in ROLLUP_MODELS)
+        db.execute(text(f"LOCK TABLE {tables} IN EXCLUSIVE MODE"))
+
+
+def _rebuild(db, columns, id_col, batch_size, to_stmts):
+    last_id, rows_seen = 0, 0
+    while True:
+        rows = db.execute(
+            select(id_col, *columns)
+            .where(id_col > last_id)
+            .order_by(id_col)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rows_seen
+        last_id = rows[-1][0]
+        rows_seen += len(rows)
+        for stmt in to_stmts(_dialect(db), [row[1:] for row in rows if row[-1] is not None]):
+            db.execute(stmt)
+
+
+def _history_missing(db):
+    # sabse purane raw row ka din daily rollup me nahi -> backfill kabhi chala
+    # hi nahi (live writes sirf naye din bharte hain). PK order, sasta lookup.
+    for model, day_col in ((Usage, UsageDaily.day), (WalletTransaction, LedgerDaily.day)):
+        first = db.scalar(
+            select(model.created_at)
+            .where(model.created_at.isnot(None))
+            .order_by(model.id)
+            .limit(1)
+        )
+        if first is not None and db.scalar(select(func.count()).where(day_col <= first.date())) == 0:
+            return True
+    return False
+
+
+def backfill(batch_size: int = 10000, if_missing: bool = False):
+    """Rollups ko raw tables se dobara banao (ek transaction, rollup tables locked).
+
+    Rebuild ke dauran live billing / wallet writes rukte hain - bade history par
+    kam traffic me chalao. if_missing=True: sirf tab jab history rollups me
+    nahi hai (pehla deploy; kai processes saath start hon to ek hi rebuild kare).
+    Returns (usage rows, ledger rows), ya None agar kuch nahi kiya.
+    """
+    db = SessionLocal()
+    try:
+        _lock_rollups(db)
+        if if_missing and not _history_missing(db):
+            db.rollback()
+            return None
+        for model in ROLLUP_MODELS:
+            db.execute(delete(model))
+
+        usage_rows = _rebuild(
+            db,
+            [Usage.user_id, Usage.resource, Usage.minutes, Usage.cost, Usage.created_at],
+            Usage.id, batch_size, usage_stmts,
+        )
+        ledger_rows = _rebuild(
+            db,
+            [WalletTransaction.user_id, func.coalesce(WalletTransaction.amount, 0), WalletTransaction.created_at],
+            WalletTransaction.id, batch_size, ledger_stmts,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info("[ROLLUP] backfill usage_rows=%s ledger_rows=%s", usage_rows, ledger_rows)
+    return usage_rows, ledger_rows
+
+
+def ensure_rollups():
+    # deploy step: summary / revenue endpoints sirf rollups padhte hain, purani
+    # history rollups me na ho to pehli baar yahin backfill (baaki starts no-op)
+    db = SessionLocal()
+    try:
+        missing = _history_missing(db)
+    finally:
+        db.close()
+    return backfill(if_missing=True) if missing else None
+
+
+if __name__ == "__main__":
+    # python -m app.rollups backfill
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m app.rollups backfill")
+    usage_rows, ledger_rows = backfill()
+    print(f"rebuilt rollups from {usage_rows} usage rows and {ledger_rows} wallet transactions")
@@ -1,5 +1,6 @@
 from app.db import SessionLocal
 from app.models import Plan
+from app.plans import invalidate_plans
 
 def seed_plans():
     db = SessionLocal()
@@ -36,3 +37,6 @@ def seed_plans():
     db.add_all(plans)
     db.commit()
     db.close()
+
+    # sab workers ka plan catalog reload
+    invalidate_plans()
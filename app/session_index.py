@@ -0,0 +1,99 @@
+import os
+import time
+import zlib
+
+from app.redis_client import r
+
+# ==================================================
+# BILLING SESSION INDEX
+# ==================================================
+# Running sessions ka sorted set, score = next bill due (unix ts).
+# Biller sirf due members uthata hai, KEYS scan ki zarurat nahi.
+#
+# Index BILL_SHARDS virtual shards me split hai (crc32 of user_id),
+# biller workers shards ko lease karke apas me baant lete hain.
+# NOTE: BILL_SHARDS sab processes me same hona chahiye.
+BILL_SHARDS = int(os.getenv("BILL_SHARDS", 64))
+
+LEGACY_INDEX_KEYS = {
+    "cpu": "billing:cpu",
+    "gpu": "billing:gpu",
+}
+
+
+def shard_for(user_id) -> int:
+    return zlib.crc32(str(user_id).encode()) % BILL_SHARDS
+
+
+def session_shard(session_key: str) -> int:
+    # cpu:{user_id}[:{pod_id}] -> shard of user_id
+    return shard_for(session_key.split(":")[1])
+
+
+def index_key(kind: str, shard: int) -> str:
+    return f"billing:{kind}:{shard}"
+
+
+def register_session(kind: str, session_key: str, due_at: float):
+    r.zadd(index_key(kind, session_shard(session_key)), {session_key: due_at})
+
+
+def unregister_session(kind: str, session_key: str):
+    r.zrem(index_key(kind, session_shard(session_key)), session_key)
+
+
+def reschedule(kind: str, session_key: str, due_at: float):
+    # XX: stop ke baad deleted session ko wapas add nahi karna
+    r.zadd(
+        index_key(kind, session_shard(session_key)),
+        {session_key: due_at},
+        xx=True,
+    )
+
+
+def due_sessions(kind: str, shard: int, now: float = None, limit: int = None):
+    now = time.time() if now is None else now
+    if limit is None:
+        return r.zrangebyscore(index_key(kind, shard), "-inf", now)
+    return r.zrangebyscore(index_key(kind, shard), "-inf", now, start=0, num=limit)
+
+
+# ==================================================
+# ONE-TIME BACKFILL (pre-index sessions)
+# ==================================================
+def _migrate_legacy_index(kind: str):
+    # unsharded billing:{kind} zset -> per-shard zsets
+    legacy = LEGACY_INDEX_KEYS[kind]
+    if r.type(legacy) != "zset":
+        return 0
+    members = r.zrange(legacy, 0, -1, withscores=True)
+    pipe = r.pipeline(transaction=False)
+    for key, due_at in members:
+        pipe.zadd(index_key(kind, session_shard(key)), {key: due_at}, nx=True)
+    pipe.delete(legacy)
+    pipe.execute()
+    return len(members)
+
+
+def rebuild_index(kind: str, interval: int):
+    added = _migrate_legacy_index(kind)
+
+    # SCAN is incremental, Redis ko block nahi karta
+    for key in r.scan_iter(match=f"{kind}:*", count=500):
+        # cpu:{user_id} ya fleet pod cpu:{user_id}:{pod_id}
+        if key.count(":") not in (1, 2):
+            continue
+        # same prefix par koi aur state (string / set) ho to HGETALL WRONGTYPE deta
+        if r.type(key) != "hash":
+            continue
+        data = r.hgetall(key)
+        if not data or data.get("running") != "1":
+            continue
+        start = int(data.get("start", 0))
+        r.zadd(
+            index_key(kind, session_shard(key)),
+            {key: start + interval},
+            nx=True,
+        )
+        added += 1
+    return added
@@ -0,0 +1,103 @@
+import os
+import socket
+import uuid
+
+from app.redis_client import r
+from app.session_index import BILL_SHARDS
+from app.logger import logger
+
+# ==================================================
+# BILLER SHARD OWNERSHIP (REDIS LEASES)
+# ==================================================
+# Har worker slot i of N ka heartbeat rakhta hai. Shard s ka owner
+# slot (s % N) hai, agar wo zinda nahi to ring me agla zinda slot.
+# Billing sirf tab hoti hai jab shard ki lease is worker ke paas ho,
+# isliye rebalance ke dauran bhi koi shard do baar bill nahi hota.
+LEASE_TTL_MS = int(os.getenv("BILLER_LEASE_TTL_MS", 30000))
+
+_RENEW = r.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+_RELEASE = r.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+
+def parse_shard_spec(spec: str):
+    # "i/N" -> (i, N)
+    slot, total = (int(x) for x in spec.split("/"))
+    if total < 1 or not 0 <= slot < total:
+        raise ValueError(f"invalid shard spec {spec!r}, expected i/N")
+    return slot, total
+
+
+def shard_owner(shard: int, alive: list, total: int):
+    preferred = shard % total
+    for step in range(total):
+        slot = (preferred + step) % total
+        if alive[slot]:
+            return slot
+    return None
+
+
+class ShardLeases:
+    def __init__(self, slot: int, total: int):
+        self.slot = slot
+        self.total = total
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned = set()
+
+    def _worker_key(self, slot: int):
+        return f"biller:worker:{self.total}:{slot}"
+
+    @staticmethod
+    def _lease_key(shard: int):
+        return f"biller:lease:{shard}"
+
+    def heartbeat(self):
+        r.set(self._worker_key(self.slot), self.worker_id, px=LEASE_TTL_MS)
+
+    def alive_slots(self):
+        values = r.mget([self._worker_key(i) for i in range(self.total)])
+        return [v is not None for v in values]
+
+    def refresh(self):
+        """Heartbeat, then acquire/renew/release leases; returns owned shards."""
+        self.heartbeat()
+        alive = self.alive_slots()
+        wanted = {
+            shard for shard in range(BILL_SHARDS)
+            if shard_owner(shard, alive, self.total) == self.slot
+        }
+
+        owned = set()
+        for shard in wanted:
+            key = self._lease_key(shard)
+            if shard in self.owned and _RENEW(keys=[key], args=[self.worker_id, LEASE_TTL_MS]):
+                owned.add(shard)
+            elif r.set(key, self.worker_id, nx=True, px=LEASE_TTL_MS):
+                owned.add(shard)
+
+        for shard in self.owned - wanted:
+            _RELEASE(keys=[self._lease_key(shard)], args=[self.worker_id])
+
+        if owned != self.owned:
+            logger.info(
+                "[BILLER] slot %s/%s now owns %s shards",
+                self.slot, self.total, len(owned)
+            )
+        self.owned = owned
+        return owned
+
+    def release_all(self):
+        for shard in self.owned:
+            _RELEASE(keys=[self._lease_key(shard)], args=[self.worker_id])
+        r.delete(self._worker_key(self.slot))
+        self.owned = set()
@@ -0,0 +1,166 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app.db import SessionLocal
+from app.models import Subscription
+from app.redis_client import r
+from app.wallet import debit_many
+from app.plans import get_plan, invalidate_user_plan
+from app.logger import logger
+from app.metrics import inc, observe
+
+# ==================================================
+# SUBSCRIPTION EXPIRY / RENEWAL SWEEPER
+# ==================================================
+# Due subscriptions (active, expires_at <= now) chhote chunks me: har chunk
+# ek short transaction - renewal debits (debit_many) + expires_at update +
+# lapsed deactivate saath commit. Postgres par FOR UPDATE SKIP LOCKED, isliye
+# do sweepers ek hi row ko double charge nahi karte aur API writes block nahi.
+SUB_PERIOD = timedelta(days=30)
+SUB_SWEEP_INTERVAL = int(os.getenv("SUB_SWEEP_INTERVAL", 60))
+SUB_SWEEP_CHUNK = int(os.getenv("SUB_SWEEP_CHUNK", 500))
+SUB_SWEEP_PAUSE = float(os.getenv("SUB_SWEEP_PAUSE", 0.05))   # chunks ke beech
+SWEEP_LOCK_KEY = "subscriptions:sweep"
+
+
+def _next_expiry(expires_at: datetime, now: datetime):
+    # billing anchor same rahe; sweeper bahut der band raha ho to aaj se
+    renewed = expires_at + SUB_PERIOD
+    return renewed if renewed > now else now + SUB_PERIOD
+
+
+def sweep_chunk(db, now: datetime, limit: int = SUB_SWEEP_CHUNK):
+    """Ek chunk process karo; returns (rows seen, renewed, lapsed)."""
+    rows = db.execute(
+        select(
+            Subscription.id,
+            Subscription.user_id,
+            Subscription.plan_id,
+            Subscription.started_at,
+            Subscription.expires_at,
+        )
+        .where(Subscription.active == True, Subscription.expires_at <= now)
+        .order_by(Subscription.expires_at, Subscription.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0, 0, 0
+
+    # ek user ke kai active subs (race): sirf latest started_at wala renew,
+    # baaki superseded - chahe woh is chunk me hon ya kisi aur me
+    latest = dict(db.execute(
+        select(Subscription.user_id, func.max(Subscription.started_at))
+        .where(
+            Subscription.user_id.in_({row.user_id for row in rows}),
+            Subscription.active == True
+        )
+        .group_by(Subscription.user_id)
+    ).all())
+
+    due = {}        # user_id -> due row to renew
+    lapsed = []     # (sub_id, user_id)
+    for row in rows:
+        if (row.started_at or datetime.min) < (latest.get(row.user_id) or datetime.min) \
+                or row.user_id in due:
+            lapsed.append((row.id, row.user_id))
+        else:
+            due[row.user_id] = row
+
+    charges, reasons, free = {}, {}, []
+    for user_id, row in due.items():
+        plan = get_plan(row.plan_id)
+        if plan is None:
+            lapsed.append((row.id, user_id))
+        elif (plan.monthly_price or 0) > 0:
+            charges[user_id] = plan.monthly_price
+            reasons[user_id] = f"Subscription renewal {plan.name}"
+        else:
+            free.append(user_id)
+
+    debited = debit_many(db, charges, reasons, commit=False) if charges else set()
+    renewed = [due[u] for u in free] + [due[u] for u in debited]
+    lapsed += [(due[u].id, u) for u in charges if u not in debited]
+
+    if renewed:
+        # bulk UPDATE by primary key (executemany)
+        db.execute(update(Subscription), [
+            {"id": row.id, "expires_at": _next_expiry(row.expires_at, now)}
+            for row in renewed
+        ])
+    if lapsed:
+        db.execute(
+            update(Subscription)
+            .where(Subscription.id.in_([sub_id for sub_id, _ in lapsed]))
+            .values(active=False),
+            execution_options={"synchronize_session": False},
+        )
+    db.commit()
+
+    # lapsed -> default plan par. Renewed bhi sirf invalidate (warm SET nahi):
+    # commit ke baad subscribe ne plan badla ho to uska invalidate overwrite
+    # na ho; agla lookup DB se sahi plan laayega
+    invalidate_user_plan(*({user_id for _, user_id in lapsed} | {row.user_id for row in renewed}))
+
+    return len(rows), len(renewed), len(lapsed)
+
+
+def sweep(now: datetime = None, chunk: int = SUB_SWEEP_CHUNK):
+    now = datetime.utcnow() if now is None else now
+    started = time.time()
+    seen = renewed = lapsed = 0
+    db = SessionLocal()
+    try:
+        while True:
+            n, ok, lost = sweep_chunk(db, now, chunk)
+            seen, renewed, lapsed = seen + n, renewed + ok, lapsed + lost
+            if n < chunk:
+                break
+            time.sleep(SUB_SWEEP_PAUSE)
+    finally:
+        db.close()
+
+    inc("subscriptions_renewed_total", renewed)
+    inc("subscriptions_lapsed_total", lapsed)
+    observe("subscriptions_sweep_seconds", time.time() - started)
+    if seen:
+        logger.info(
+            "[SUBS] sweep due=%s renewed=%s lapsed=%s took=%.3fs",
+            seen, renewed, lapsed, time.time() - started
+        )
+    return renewed, lapsed
+
+
+def maybe_sweep():
+    # fleet me har SUB_SWEEP_INTERVAL me ek hi worker sweep shuru kare
+    if r.set(SWEEP_LOCK_KEY, socket.gethostname(), nx=True, ex=SUB_SWEEP_INTERVAL):
+        return sweep()
+    return None
+
+
+def _loop():
+    while True:
+        try:
+            maybe_sweep()
+        except Exception:
+            logger.error("[SUBS] sweep error\n%s", traceback.format_exc())
+        time.sleep(SUB_SWEEP_INTERVAL / 4)
+
+
+def start_sweeper():
+    thread = threading.Thread(target=_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    # python -m app.subscription_sweeper   (ek baar, abhi)
+    renewed, lapsed = sweep()
+    print(f"renewed={renewed} lapsed={lapsed}")
@@ -1,24 +1,24 @@
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 
-from app.db import SessionLocal
+from app.db import get_db
 from app.models import Subscription, Plan
 from app.deps import get_current_user
 from app.wallet import debit
+from app.plans import catalog_etag, invalidate_user_plan, plan_catalog
 
 router = APIRouter(prefix="/subscription", tags=["Subscription"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/plans")
-def list_plans(db: Session = Depends(get_db)):
-    return db.query(Plan).all()
+def list_plans(request: Request, response: Response):
+    # process cache se; client ETag match kare to 304
+    etag = catalog_etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return [vars(plan) for plan in plan_catalog().values()]
 
 @router.post("/subscribe")
 def subscribe(
@@ -52,6 +52,9 @@ def subscribe(
     db.add(sub)
     db.commit()
 
+    # biller / stop pricing ab naya plan dekhe
+    invalidate_user_plan(user_id)
+
     return {"status": "subscribed", "plan": plan.name}
 
 @router.get("/current")
@@ -59,7 +62,8 @@ def current_subscription(
     user_id: int = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    # latest active subscription (subscribe purane deactivate karta hai)
     return db.query(Subscription).filter(
         Subscription.user_id == user_id,
         Subscription.active == True
-    ).first()
+    ).order_by(Subscription.started_at.desc()).first()
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+from app.redis_client import r
+from app.bloom import BloomFilter
+from app.logger import logger
+
+# ==================================================
+# JWT REVOCATION DENYLIST
+# ==================================================
+# Redis zset jwt:denylist (jti -> token exp) source of truth hai.
+# Har worker ke paas uska bloom filter: miss = not revoked (no Redis call),
+# hit = Redis se confirm. Naye revokes pub/sub se turant aate hain, aur
+# JWT_DENYLIST_SYNC sec me poora filter rebuild (expired jtis prune).
+DENYLIST_KEY = "jwt:denylist"
+REVOKE_CHANNEL = "jwt:revoke"
+JWT_DENYLIST_CAPACITY = int(os.getenv("JWT_DENYLIST_CAPACITY", 100000))
+JWT_DENYLIST_SYNC = int(os.getenv("JWT_DENYLIST_SYNC", 300))
+
+_bloom = BloomFilter(JWT_DENYLIST_CAPACITY)
+
+
+def revoke(jti: str, exp: float):
+    r.zadd(DENYLIST_KEY, {jti: exp})
+    _bloom.add(jti)
+    r.publish(REVOKE_CHANNEL, jti)
+
+
+def is_revoked(jti: str) -> bool:
+    if jti not in _bloom:
+        return False
+    return r.zscore(DENYLIST_KEY, jti) is not None
+
+
+def _rebuild():
+    global _bloom
+    now = time.time()
+    r.zremrangebyscore(DENYLIST_KEY, "-inf", now)
+    bloom = BloomFilter(JWT_DENYLIST_CAPACITY)
+    for jti in r.zrangebyscore(DENYLIST_KEY, now, "+inf"):
+        bloom.add(jti)
+    _bloom = bloom
+
+
+def _sync():
+    while True:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(REVOKE_CHANNEL)
+            _rebuild()
+            rebuilt_at = time.time()
+            while True:
+                msg = pubsub.get_message(timeout=1.0)
+                if msg and msg["type"] == "message":
+                    _bloom.add(msg["data"])
+                if time.time() - rebuilt_at > JWT_DENYLIST_SYNC:
+                    _rebuild()
+                    rebuilt_at = time.time()
+        except Exception:
+            logger.warning("[JWT] denylist sync reconnecting", exc_info=True)
+            time.sleep(1)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+def start_denylist_sync():
+    threading.Thread(target=_sync, daemon=True).start()
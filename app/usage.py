@@ -1,60 +1,104 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from datetime import datetime
+from typing import Optional
 
-from app.db import SessionLocal
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.db import get_async_db
 from app.models import Usage
 from app.deps import get_current_user
+from app.rollups import usage_by_resource
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    astream_rows,
+    export_response,
+    keyset,
+    page,
+)
 
 router = APIRouter(prefix="/usage", tags=["Usage"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# =========================
+# AGGREGATION HELPERS
+# =========================
+def totals_by_resource(rows):
+    # {resource: (cost, minutes)}
+    return {
+        resource: (cost or 0, minutes or 0)
+        for resource, cost, minutes in rows
+    }
 
 # =========================
-# FULL USAGE HISTORY
+# USAGE HISTORY (KEYSET PAGES)
 # =========================
+HISTORY_COLUMNS = ("id", "resource", "minutes", "cost", "created_at")
+
+
+def _history_stmt(user_id: int, start: datetime = None, end: datetime = None):
+    # sirf columns, ORM objects nahi (ix_usage_user_created)
+    stmt = select(
+        Usage.id,
+        Usage.resource,
+        Usage.minutes,
+        Usage.cost,
+        Usage.created_at,
+    ).where(Usage.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(Usage.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Usage.created_at < end)
+    return stmt
+
+
 @router.get("")
-def usage_history(
+async def usage_history(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     user_id: int = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    rows = (
-        db.query(Usage)
-        .filter(Usage.user_id == user_id)
-        .order_by(Usage.created_at.desc())
-        .all()
+    stmt = keyset(
+        _history_stmt(user_id, start, end),
+        [Usage.created_at, Usage.id],
+        cursor
     )
-    return rows
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    return page(rows, limit, ["created_at", "id"])
+
+
+@router.get("/export")
+async def usage_export(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: int = Depends(get_current_user),
+):
+    # server-side cursor: memory constant, history kitni bhi lambi ho
+    rows = astream_rows(
+        keyset(_history_stmt(user_id, start, end), [Usage.created_at, Usage.id])
+    )
+    return export_response(rows, format, HISTORY_COLUMNS, f"usage-{user_id}")
 
 # =========================
 # USAGE SUMMARY
 # =========================
 @router.get("/summary")
-def usage_summary(
+async def usage_summary(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     user_id: int = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    total = db.query(func.sum(Usage.cost)).filter(
-        Usage.user_id == user_id
-    ).scalar() or 0
-
-    cpu = db.query(func.sum(Usage.cost)).filter(
-        Usage.user_id == user_id,
-        Usage.resource == "cpu"
-    ).scalar() or 0
-
-    gpu = db.query(func.sum(Usage.cost)).filter(
-        Usage.user_id == user_id,
-        Usage.resource == "gpu"
-    ).scalar() or 0
+    totals = totals_by_resource(
+        await db.execute(usage_by_resource(user_id, start, end))
+    )
 
     return {
-        "total_spent": total,
-        "cpu_spent": cpu,
-        "gpu_spent": gpu
+        "total_spent": sum(cost for cost, _ in totals.values()),
+        "cpu_spent": totals.get("cpu", (0, 0))[0],
+        "gpu_spent": totals.get("gpu", (0, 0))[0]
     }
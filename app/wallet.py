@@ -1,21 +1,157 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models import User, WalletTransaction
+from app.rollups import record_ledger, record_ledger_async
+
+_NO_SYNC = {"synchronize_session": False}
+
+def _credit_stmt(user_id: int, amount: float):
+    # single statement: concurrent credits/debits ek dusre ko overwrite nahi karte
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(wallet=func.coalesce(User.wallet, 0) + amount)
+        .returning(User.wallet)
+    )
+
+def _debit_stmt(user_id: int, amount: float):
+    # check + decrement ek hi conditional UPDATE me (no lost updates)
+    return (
+        update(User)
+        .where(User.id == user_id, User.wallet >= amount)
+        .values(wallet=User.wallet - amount)
+        .returning(User.wallet)
+    )
 
 def get_balance(db: Session, user_id: int):
     user = db.query(User).filter(User.id == user_id).first()
     return user.wallet if user else 0.0
 
 def credit(db: Session, user_id: int, amount: float, reason: str):
-    user = db.query(User).filter(User.id == user_id).first()
-    user.wallet += amount
-    db.add(WalletTransaction(user_id=user_id, amount=amount, reason=reason))
+    balance = db.execute(_credit_stmt(user_id, amount), execution_options=_NO_SYNC).scalar()
+    if balance is None:
+        raise ValueError(f"user {user_id} not found")
+    now = datetime.utcnow()
+    db.add(WalletTransaction(user_id=user_id, amount=amount, reason=reason, created_at=now))
+    record_ledger(db, [(user_id, amount, now)])
     db.commit()
+    return balance
 
 def debit(db: Session, user_id: int, amount: float, reason: str):
-    user = db.query(User).filter(User.id == user_id).first()
-    if user.wallet < amount:
+    balance = db.execute(_debit_stmt(user_id, amount), execution_options=_NO_SYNC).scalar()
+    if balance is None:
         return False
-    user.wallet -= amount
-    db.add(WalletTransaction(user_id=user_id, amount=-amount, reason=reason))
+    now = datetime.utcnow()
+    db.add(WalletTransaction(user_id=user_id, amount=-amount, reason=reason, created_at=now))
+    record_ledger(db, [(user_id, -amount, now)])
     db.commit()
     return True
+
+# ==================================================
+# ASYNC VARIANTS (AsyncSession)
+# ==================================================
+async def get_balance_async(db: AsyncSession, user_id: int):
+    balance = await db.scalar(select(User.wallet).where(User.id == user_id))
+    return balance or 0.0
+
+async def credit_async(db: AsyncSession, user_id: int, amount: float, reason: str):
+    balance = (await db.execute(_credit_stmt(user_id, amount), execution_options=_NO_SYNC)).scalar()
+    if balance is None:
+        raise ValueError(f"user {user_id} not found")
+    now = datetime.utcnow()
+    db.add(WalletTransaction(user_id=user_id, amount=amount, reason=reason, created_at=now))
+    await record_ledger_async(db, [(user_id, amount, now)])
+    await db.commit()
+    return balance
+
+async def debit_async(db: AsyncSession, user_id: int, amount: float, reason: str):
+    balance = (await db.execute(_debit_stmt(user_id, amount), execution_options=_NO_SYNC)).scalar()
+    if balance is None:
+        return False
+    now = datetime.utcnow()
+    db.add(WalletTransaction(user_id=user_id, amount=-amount, reason=reason, created_at=now))
+    await record_ledger_async(db, [(user_id, -amount, now)])
+    await db.commit()
+    return True
+
+# ==================================================
+# BULK DEBIT (BILLER TICK)
+# ==================================================
+def debit_many(db: Session, charges: dict, reason, commit: bool = True):
+    """Debit {user_id: amount} in one transaction; returns debited user ids.
+
+    reason: ek string, ya per-user {user_id: reason} dict.
+    commit=False: caller apne updates ke saath ek hi transaction me commit kare.
+    """
+    by_amount = defaultdict(list)
+    for user_id, amount in charges.items():
+        by_amount[amount].append(user_id)
+
+    debited = set()
+    rows = []
+    now = datetime.utcnow()
+    # ek UPDATE per distinct amount (flat per-minute price = ek hi statement)
+    for amount, user_ids in by_amount.items():
+        result = db.execute(
+            update(User)
+            .where(User.id.in_(user_ids), User.wallet >= amount)
+            .values(wallet=User.wallet - amount)
+            .returning(User.id),
+            execution_options=_NO_SYNC,
+        )
+        for (user_id,) in result:
+            debited.add(user_id)
+            rows.append({
+                "user_id": user_id,
+                "amount": -amount,
+                "reason": reason if isinstance(reason, str) else reason[user_id],
+                "created_at": now,
+            })
+
+    if rows:
+        db.execute(insert(WalletTransaction), rows)
+        record_ledger(db, [(row["user_id"], row["amount"], now) for row in rows])
+    if commit:
+        db.commit()
+    return debited
+
+# ==================================================
+# BULK CREDIT (PAYMENT WORKER)
+# ==================================================
+def credit_many(db: Session, credits, commit: bool = True):
+    """Credit [(user_id, amount, reason)] in one transaction; returns credited user ids.
+
+    Har credit ka apna WalletTransaction row; wallet UPDATE per user ek (summed),
+    executemany me. Missing users skip hote hain.
+    """
+    totals = defaultdict(float)
+    for user_id, amount, _ in credits:
+        totals[user_id] += amount
+    if not totals:
+        return set()
+
+    credited = set(db.scalars(select(User.id).where(User.id.in_(totals))))
+    if credited:
+        users = User.__table__
+        db.execute(
+            update(users)
+            .where(users.c.id == bindparam("b_user_id"))
+            .values(wallet=func.coalesce(users.c.wallet, 0) + bindparam("b_amount")),
+            # sorted: concurrent batches row locks same order me lete hain
+            [{"b_user_id": u, "b_amount": totals[u]} for u in sorted(credited)],
+        )
+
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "amount": amount, "reason": reason, "created_at": now}
+            for user_id, amount, reason in credits if user_id in credited
+        ]
+        db.execute(insert(WalletTransaction), rows)
+        record_ledger(db, [(row["user_id"], row["amount"], now) for row in rows])
+    if commit:
+        db.commit()
+    return credited
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import time
+import uuid
+
+from app.redis_client import r
+from app.container_host import DockerError, get_host
+from app.logger import logger
+
+# ==================================================
+# WARM CONTAINER POOL
+# ==================================================
+# Har (host, image) ke liye idle containers ki Redis list. Start par ek
+# container LPOP karke user ke naam par rename hota hai (cold `docker run`
+# nahi). Background refill pool ko low-water mark tak bharta hai; koi
+# claim na ho to POOL_IDLE_SECONDS ke baad POOL_MIN_IDLE tak shrink.
+# Stop par container hamesha destroy hota hai - kisi user ka container kabhi
+# pool me wapas nahi jaata (tmpfs, volumes, processes dusre tenant tak leak).
+POOL_LOW_WATER = int(os.getenv("POOL_LOW_WATER", 2))
+POOL_MIN_IDLE = int(os.getenv("POOL_MIN_IDLE", 0))
+POOL_IDLE_SECONDS = int(os.getenv("POOL_IDLE_SECONDS", 1800))
+POOL_REFILL_INTERVAL = int(os.getenv("POOL_REFILL_INTERVAL", 5))
+
+# lock sirf wahi release kare jisne liya (refill TTL se lamba chala ho to
+# tab tak kisi aur worker ka lock ho sakta hai)
+_RELEASE_LOCK = r.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+
+class WarmPool:
+    def __init__(self, kind: str, host_address: str, image: str, run_args):
+        # run_args(container_name) -> docker run args (image ke saath)
+        self.kind = kind
+        self.host_address = host_address
+        self.image = image
+        self.run_args = run_args
+        base = f"pool:{host_address}:{image}"
+        self.list_key = base
+        self.claimed_key = f"{base}:claimed_at"
+        self.lock_key = f"{base}:refill_lock"
+
+    @property
+    def host(self):
+        return get_host(self.host_address)
+
+    def _pool_name(self):
+        return f"cloudpod-pool-{self.kind}-{uuid.uuid4().hex[:12]}"
+
+    # ------------------------------
+    # CLAIM (START PATH)
+    # ------------------------------
+    async def claim(self, container_name: str) -> bool:
+        """Idle container ko container_name par rename karo; pool khali ho to False."""
+        r.set(self.claimed_key, int(time.time()))
+        while True:
+            pooled = r.lpop(self.list_key)
+            if pooled is None:
+                return False
+            try:
+                await self.host.adocker("rename", pooled, container_name)
+                return True
+            except DockerError:
+                # pooled container mar chuka hai, hata ke agla try karo
+                logger.warning("[POOL] dead pooled container %s", pooled)
+                try:
+                    await self.host.adocker("rm", "-f", pooled)
+                except DockerError:
+                    pass
+
+    # ------------------------------
+    # BACKGROUND REFILL / SHRINK
+    # ------------------------------
+    def _target(self):
+        last_claim = int(r.get(self.claimed_key) or 0)
+        if time.time() - last_claim > POOL_IDLE_SECONDS:
+            return POOL_MIN_IDLE
+        return POOL_LOW_WATER
+
+    async def maintain(self):
+        # ek hi process ek pool ko maintain kare (multi-worker deploy)
+        token = uuid.uuid4().hex
+        if not r.set(self.lock_key, token, nx=True, ex=max(30, POOL_REFILL_INTERVAL * 6)):
+            return
+        try:
+            target = self._target()
+            size = r.llen(self.list_key)
+
+            while size < target:
+                name = self._pool_name()
+                await self.host.adocker(*self.run_args(name))
+                size = r.rpush(self.list_key, name)
+
+            while size > target:
+                pooled = r.rpop(self.list_key)
+                if pooled is None:
+                    break
+                await self.host.adocker("rm", "-f", pooled)
+                size -= 1
+        finally:
+            _RELEASE_LOCK(keys=[self.lock_key], args=[token])
+
+
+_pools = []
+
+
+def register_pool(pool: WarmPool):
+    _pools.append(pool)
+    return pool
+
+
+async def refill_loop():
+    logger.info("[POOL] refill loop started pools=%s", len(_pools))
+    while True:
+        for pool in _pools:
+            if not pool.host_address:
+                continue
+            try:
+                await pool.maintain()
+            except Exception:
+                logger.exception("[POOL] refill failed pool=%s", pool.list_key)
+        await asyncio.sleep(POOL_REFILL_INTERVAL)
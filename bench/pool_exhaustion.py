@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import metrics
+from app.db import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PGBOUNCER,
+    SessionLocal,
+    engine,
+)
+
+# ==================================================
+# POOL EXHAUSTION BENCHMARK
+# ==================================================
+# N threads (= ek process ke concurrent requests) har ek session khol ke
+# query chalate hain aur connection --hold sec tak pakde rehte hain.
+# Output: throughput, checkout wait percentiles, pool timeouts.
+#
+#   DATABASE_URL=postgresql://... DB_POOL_SIZE=5 DB_MAX_OVERFLOW=10 \
+#       python bench/pool_exhaustion.py --threads 50 --hold 0.05 --duration 20
+#
+# Sizing: workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) < Postgres max_connections
+# (superuser_reserved_connections aur dusre clients ke liye jagah chhodo).
+
+
+def _hold_query(seconds: float):
+    if engine.dialect.name == "postgresql":
+        return text("SELECT pg_sleep(:s)"), {"s": seconds}
+    return text("SELECT 1"), {}
+
+
+def _worker(deadline: float, hold: float, stats: dict, lock: threading.Lock):
+    query, params = _hold_query(hold)
+    while time.time() < deadline:
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.execute(query, params)
+            if engine.dialect.name != "postgresql":
+                time.sleep(hold)
+            ok = True
+        except PoolTimeout:
+            ok = False
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                stats["latencies"].append(elapsed)
+            else:
+                stats["timeouts"] += 1
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLAlchemy pool exhaustion benchmark")
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--hold", type=float, default=0.05, help="sec per checkout")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    stats = {"latencies": [], "timeouts": 0}
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+
+    threads = [
+        threading.Thread(target=_worker, args=(deadline, args.hold, stats, lock))
+        for _ in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lat = stats["latencies"]
+    waits = metrics.snapshot()["summaries"].get("db_pool_wait_seconds", {})
+    print(f"url={engine.url.render_as_string(hide_password=True)} pgbouncer={DB_PGBOUNCER}")
+    print(
+        f"pool_size={DB_POOL_SIZE} max_overflow={DB_MAX_OVERFLOW} "
+        f"timeout={DB_POOL_TIMEOUT}s threads={args.threads} hold={args.hold}s"
+    )
+    print(f"requests={len(lat)} rps={len(lat) / args.duration:.1f} timeouts={stats['timeouts']}")
+    print(
+        f"latency p50={_pct(lat, 0.5) * 1000:.1f}ms "
+        f"p95={_pct(lat, 0.95) * 1000:.1f}ms p99={_pct(lat, 0.99) * 1000:.1f}ms"
+    )
+    if waits.get("count"):
+        print(
+            f"checkout wait avg={waits['sum'] / waits['count'] * 1000:.1f}ms "
+            f"max={waits['max'] * 1000:.1f}ms"
+        )
+    print(f"gauges={metrics.snapshot()['gauges']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,13 @@
 #!/bin/bash
-uvicorn app.main:app --host 0.0.0.0 --port $PORT
+# biller (per-minute billing, low-balance stop, subscription sweeper) API ke
+# saath; crash ho to restart. Alag service me chalana ho to BILLER=0 set karo
+# aur wahan: python -m app.biller --shard i/N
+if [ "${BILLER:-1}" = "1" ]; then
+    (while true; do
+        python -m app.biller --shard "${BILLER_SHARD:-0/1}"
+        echo "biller exited, restarting in 5s" >&2
+        sleep 5
+    done) &
+fi
+
+exec uvicorn app.main:app --host 0.0.0.0 --port $PORT